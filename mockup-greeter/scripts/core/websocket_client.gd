@@ -221,6 +221,7 @@ func send_iot_command(entity_id: String, new_state: String) -> bool:
 ## Sends natural language text command with backend-expected structure
 ## @param text: User command text
 ## @param entity_id: Entity ID for context (default: "light.led_rgb_square")
+## No history is sent: the backend keeps the conversation of this connection
 ## @return True if command was sent successfully
 func send_text_command(text: String, entity_id: String) -> bool:
 	# Queue message if not connected
@@ -230,8 +231,7 @@ func send_text_command(text: String, entity_id: String) -> bool:
 			"type": "text_command",
 			"data": {
 				"entity_id": entity_id,
-				"text": text,
-				"history": []
+				"text": text
 			}
 		})
 		return false
@@ -241,8 +241,7 @@ func send_text_command(text: String, entity_id: String) -> bool:
 		"type": "text_command",
 		"data": {
 			"entity_id": entity_id,
-			"text": text,
-			"history": []
+			"text": text
 		}
 	}
 	
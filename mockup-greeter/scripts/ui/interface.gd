@@ -421,7 +421,8 @@ func _send_text_message() -> void:
 	# Send with full conversation history
 	_send_text_command_with_history(text)
 
-## Send text command with full conversation history and selected entity_id
+## Send text command with selected entity_id
+## The backend keeps the conversation history of this connection, so only the new utterance is sent
 ## Omits entity_id field entirely if no object selected (general smart room conversation)
 func _send_text_command_with_history(text: String) -> void:
 	if not websocket_client:
@@ -429,8 +430,7 @@ func _send_text_command_with_history(text: String) -> void:
 	
 	# Prepare message data
 	var message_data = {
-		"text": text,
-		"history": conversation_history
+		"text": text
 	}
 	
 	# Only include entity_id if a specific object is selected
@@ -440,13 +440,12 @@ func _send_text_command_with_history(text: String) -> void:
 	else:
 		print("[Interface] Sending command without entity (general smart room conversation)")
 	
-	print("[Interface] History: %d messages" % conversation_history.size())
 	
 	# Send message with or without entity_id
 	var success = websocket_client.send_message("text_command", message_data)
 	
 	if success:
-		print("[Interface] Text sent with history")
+		print("[Interface] Text sent")
 	else:
 		print("[ERROR] Failed to send text")
 
@@ -581,6 +580,8 @@ func _add_message_to_chat(sender: String, content: String) -> void:
 ## Clear conversation history (useful for starting fresh conversation)
 func clear_history() -> void:
 	conversation_history.clear()
+	if websocket_client:
+		websocket_client.send_message("reset_conversation")
 	print("[Interface] History cleared")
 
 ## Manually reset object selection (clears selected entity_id)
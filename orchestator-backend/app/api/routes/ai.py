@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
-from app.services.ai_service import ask_gemini
+from app.services import gemini_client
+from app.services.ai_service import ask_gemini, response_cache
 from app.utils import color_style
 router = APIRouter()
 
@@ -13,6 +14,21 @@ async def generate(prompt_req: PromptRequest):
     result = await ask_gemini(prompt_req.prompt)
     return {"response": result}
 
+@router.get("/cache")
+async def cache_stats():
+    return response_cache.stats()
+
+
+@router.delete("/cache")
+async def clear_cache():
+    response_cache.clear()
+    return {"message": "Gemini cache cleared"}
+
+
+@router.get("/breaker")
+async def breaker_state():
+    return gemini_client.stats()
+
 # @router.get("/models")
 # async def list_models():
 #     result = await list_gemini_models()
@@ -1,9 +1,13 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import get_db
 from app.repositories.entity_repository import EntityRepository
 import app.services.db_service as db_service
+from app.services import history_service
 from app.schemas.entity import (
     EntityCreate,
     EntityUpdate,
@@ -25,6 +29,96 @@ async def create_entity(
         raise HTTPException(status_code=500, detail=f"Could not create entity: {str(e)}")
 
 
+async def _ndjson(request: Request):
+    """Parse an NDJSON request body line by line as it arrives"""
+    buffer = b""
+    line_no = 0
+
+    def parse(line: bytes):
+        try:
+            return json.loads(line)
+        except ValueError as e:
+            return ValueError(f"Invalid JSON on line {line_no}: {e}")
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                yield parse(line)
+    if buffer.strip():
+        line_no += 1
+        yield parse(buffer)
+
+
+@router.post("/bulk")
+async def bulk_upsert_entities(
+    request: Request,
+    from_ha: bool = False,
+    domain: Optional[List[str]] = Query(None),
+    chunk_size: int = Query(500, ge=1, le=5000),
+    merge_attributes: bool = False,
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    """Insert or update many entities in one transaction
+
+    The body is a JSON array (or {"entities": [...]}) or NDJSON
+    (Content-Type application/x-ndjson), with entities in Home Assistant
+    `/states` format. With from_ha=true the entities are read from Home
+    Assistant instead. `domain` (repeatable) keeps only those domains.
+    """
+    content_type = request.headers.get("content-type", "")
+    if from_ha:
+        return await db_service.import_ha_entities(
+            db, domains=domain, chunk_size=chunk_size, merge_attributes=merge_attributes
+        )
+
+    if "ndjson" in content_type or "jsonl" in content_type:
+        items = _ndjson(request)
+    else:
+        try:
+            body = await request.json()
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {str(e)}")
+        items = body.get("entities") if isinstance(body, dict) else body
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Expected a list of entities")
+
+    return await db_service.bulk_upsert_entities(
+        items, db, chunk_size=chunk_size, merge_attributes=merge_attributes, domains=domain
+    )
+
+
+async def _export_ndjson(batch_size: int):
+    async for entity in db_service.stream_entities(batch_size=batch_size):
+        yield entity.model_dump_json() + "\n"
+
+
+async def _export_json(batch_size: int):
+    yield "["
+    separator = ""
+    async for entity in db_service.stream_entities(batch_size=batch_size):
+        yield separator + entity.model_dump_json()
+        separator = ","
+    yield "]"
+
+
+@router.get("/export")
+async def export_entities(
+    format: str = Query("ndjson", pattern="^(ndjson|json)$"),
+    batch_size: int = Query(500, ge=1, le=5000)
+) -> StreamingResponse:
+    """Stream every entity as NDJSON (default) or a JSON array
+
+    Rows come from a server-side cursor, so memory use does not grow with
+    the number of entities.
+    """
+    if format == "json":
+        return StreamingResponse(_export_json(batch_size), media_type="application/json")
+    return StreamingResponse(_export_ndjson(batch_size), media_type="application/x-ndjson")
+
+
 @router.get("/{entity_id}", response_model=EntityResponse)
 async def get_entity(
     entity_id: str,
@@ -39,11 +133,71 @@ async def get_entity(
 
 @router.get("/", response_model=List[EntityResponse])
 async def get_entities(
+    response: Response,
+    after: Optional[str] = None,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=1000),
     db: AsyncSession = Depends(get_db)
 ) -> List[EntityResponse]:
-    return await db_service.get_entities(skip=skip, limit=limit, db=db)
+    """List entities ordered by entity_id
+
+    Paginate with `after`: pass the X-Next-Cursor header of the previous
+    page (absent on the last page). `skip` (OFFSET) is still accepted but
+    gets slower the deeper the page.
+    """
+    if skip:
+        return await db_service.get_entities(skip=skip, limit=limit, db=db)
+    entities, next_cursor = await db_service.get_entities_page(after=after, limit=limit, db=db)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return entities
+
+
+@router.get("/{entity_id}/history")
+async def get_entity_history(
+    entity_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    bucket: Optional[str] = None,
+    limit: int = Query(5000, ge=1, le=50000),
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    """State history of an entity between start and end (default: last 24 h)
+
+    Without `bucket` the newest `limit` raw state changes are returned, and
+    `truncated` tells whether older ones in the range were left out.
+    With `bucket` (e.g. 30s, 5m, 1h, 1d) the series is downsampled in SQL
+    to count/min/max/avg/last of the numeric value per interval.
+    """
+    # Rows are recorded in naive local time
+    if end and end.tzinfo:
+        end = end.astimezone().replace(tzinfo=None)
+    if start and start.tzinfo:
+        start = start.astimezone().replace(tzinfo=None)
+    end = end or datetime.now()
+    start = start or end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    bucket_seconds = None
+    if bucket:
+        try:
+            bucket_seconds = history_service.parse_interval(bucket)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if (end - start).total_seconds() / bucket_seconds > limit:
+            raise HTTPException(status_code=400, detail="Too many buckets for the range, use a larger bucket")
+
+    points, truncated = await db_service.get_entity_history(
+        entity_id, start, end, db, bucket_seconds=bucket_seconds, limit=limit
+    )
+    return {
+        "entity_id": entity_id,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "bucket_seconds": bucket_seconds,
+        "points": points,
+        "truncated": truncated,
+    }
 
 
 @router.put("/{entity_id}", response_model=EntityResponse)
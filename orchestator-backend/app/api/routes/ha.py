@@ -1,29 +1,35 @@
 from fastapi import APIRouter
 from app.services import ha_service
+from app.services.state_cache_service import state_cache
 
 router = APIRouter()
 
 
 @router.get("/get-devices")
-async def get_devices():
-    return await ha_service.get_ha_devices()
+async def get_devices(refresh: bool = False):
+    return await ha_service.get_ha_devices(refresh=refresh)
 
 
 @router.get("/get-device/{entity_id}")
-async def get_device(entity_id: str):
-    return await ha_service.get_ha_device(entity_id)
+async def get_device(entity_id: str, refresh: bool = False):
+    return await ha_service.get_ha_device(entity_id, refresh=refresh)
 
 
 @router.get("/get-devices/{domain}")
-async def get_devices_by_domain(domain: str):
-    return await ha_service.get_ha_devices_by_domain(domain)
+async def get_devices_by_domain(domain: str, refresh: bool = False):
+    return await ha_service.get_ha_devices_by_domain(domain, refresh=refresh)
 
 
 @router.get("/get-single-device/{domain}")
-async def get_single_device(domain: str):
-    return await ha_service.get_single_ha_device(domain)
+async def get_single_device(domain: str, refresh: bool = False):
+    return await ha_service.get_single_ha_device(domain, refresh=refresh)
 
 
 @router.post("/change-state/{entity_id}/{new_state}")
 async def change_state(entity_id: str, new_state: str):
     await ha_service.change_ha_entity_state(entity_id, new_state)
+
+
+@router.get("/cache")
+async def cache_stats():
+    return state_cache.stats()
@@ -1,5 +1,6 @@
 from fastapi import APIRouter
 from app.services import db_service
+from app.services.state_writer_service import state_writer
 
 router = APIRouter()
 
@@ -7,3 +8,9 @@ router = APIRouter()
 async def db_check():
     result = await db_service.test_connection()
     return {"ok": bool(result)}
+
+
+@router.get("/state-writer")
+async def state_writer_stats():
+    """Write-behind queue depth and flush counters"""
+    return state_writer.stats()
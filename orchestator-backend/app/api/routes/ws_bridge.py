@@ -2,7 +2,7 @@
 Unified WebSocket Bridge
 
 Handles all Godot-Backend communication via WebSocket with support for:
-- Audio command processing (STT, NLP, TTS)
+- Audio command processing (STT, NLP, TTS), as base64 JSON or binary frames
 - IoT device control
 - Text-based natural language commands
 - Status requests and connection management
@@ -15,6 +15,7 @@ from typing import Dict, Any
 import json
 import base64
 import asyncio
+import uuid
 from datetime import datetime
 from app.services.ws_manager_service import ConnectionManager
 from app.utils import color_style
@@ -23,6 +24,30 @@ router = APIRouter(tags=["WebSocket"])
 # Global connection manager instance
 manager = ConnectionManager()
 
+
+async def receive_loop(websocket: WebSocket, client_id: str):
+    """
+    Read frames until the client disconnects
+
+    Text frames are JSON messages dispatched to the manager. Binary frames
+    carry raw audio for an upload opened with audio_start.
+    """
+    while True:
+        frame = await websocket.receive()
+        if frame["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(frame.get("code", 1000))
+
+        if frame.get("bytes") is not None:
+            await manager.receive_binary(frame["bytes"], client_id)
+            continue
+
+        message = json.loads(frame["text"])
+        message_type = message.get("type", "unknown")
+        print(f"{color_style.LOGGER} From {client_id}: {message_type}")
+
+        # Handle the message concurrently; the reply is queued with its request_id
+        await manager.dispatch(message, client_id)
+
 @router.websocket("/unified")
 async def unified_websocket(websocket: WebSocket):
     """
@@ -35,21 +60,11 @@ async def unified_websocket(websocket: WebSocket):
     - Device state queries
     - Connection keep-alive
     """
-    client_id = f"client_{id(websocket)}"
+    client_id = f"client_{uuid.uuid4().hex}"
     await manager.connect(websocket, client_id)
 
     try:
-        while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
-            message_type = message.get("type", "unknown")
-            print(f"{color_style.LOGGER} From {client_id}: {message_type}")
-
-            # Route message to appropriate handler
-            response = await manager.route_message(message, client_id)
-
-            # Send response back to client
-            await websocket.send_json(response)
+        await receive_loop(websocket, client_id)
 
     except WebSocketDisconnect:
         manager.disconnect(client_id)
@@ -58,26 +73,22 @@ async def unified_websocket(websocket: WebSocket):
         print(f"{color_style.ERROR} Client {client_id}: {str(e)}")
         manager.disconnect(client_id)
 
+@router.get("/stats")
+async def ws_stats():
+    """Outbound queue depth and drop counters per connected client"""
+    return manager.stats()
+
+
 @router.websocket("/topic")
 async def ws_write(websocket: WebSocket):
     """
     This route will be used to communicate the backend and Godot via WebSocket
     """
-    client_id = f"client_{id(websocket)}"
+    client_id = f"client_{uuid.uuid4().hex}"
     await manager.connect(websocket, client_id)
 
     try:
-        while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
-            message_type = message.get("type", "unknown")
-            print(f"{color_style.LOGGER} From {client_id}: {message_type}")
-
-            # Route message to appropriate handler
-            response = await manager.route_message(message, client_id)
-
-            # Send response back to client
-            await websocket.send_json(response)
+        await receive_loop(websocket, client_id)
 
     except WebSocketDisconnect:
         manager.disconnect(client_id)
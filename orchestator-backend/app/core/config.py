@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 
@@ -14,6 +15,94 @@ class Settings(BaseSettings):
     gemini_api_key: str
     gemini_base_url: str
 
+    # Home Assistant REST client (shared, pooled)
+    ha_timeout: float = 10.0
+    ha_connect_timeout: float = 5.0
+    ha_max_connections: int = 20
+    ha_max_keepalive_connections: int = 10
+    ha_keepalive_expiry: float = 30.0
+    ha_http2: bool = False
+
+    # Seconds a state cache seed stays valid while the HA WebSocket is down
+    ha_state_cache_max_age: float = 30.0
+
+    # Write-behind persistence of state_changed events
+    state_flush_interval: float = 1.0
+    state_flush_batch_size: int = 100
+    state_max_pending: int = 5000
+
+    # Outbound WebSocket queues: drop_oldest, coalesce or disconnect
+    ws_client_queue_size: int = 256
+    ws_slow_consumer_policy: str = "drop_oldest"
+    # Handlers running at once per WebSocket connection
+    ws_max_inflight: int = 4
+
+    # Whisper worker pool (None = one per core, 0 = run in the API process)
+    whisper_workers: Optional[int] = None
+    whisper_max_queue: int = 8
+    whisper_max_wait: float = 2.0
+    # Whisper model lifecycle
+    whisper_model_size: str = "small"
+    whisper_device: str = "cpu"
+    whisper_compute_type: str = "default"  # e.g. int8, float32
+    # Let profiles load their own compute type (fast: int8, accurate: float32).
+    # Each distinct type is another copy of the model in every worker process.
+    whisper_profile_compute_types: bool = False
+    whisper_warmup: bool = False
+    whisper_idle_unload: float = 0.0  # seconds idle before unloading, 0 = never
+    # Default transcription profile (fast, balanced, accurate). Profiles that
+    # pin the language use whisper_language (e.g. "en"); None = auto-detect
+    whisper_profile: str = "balanced"
+    whisper_language: Optional[str] = None
+    # Partial transcripts while a streaming upload is still recording
+    stt_partial_interval: float = 1.0
+    stt_partial_window: float = 15.0
+    stt_partial_profile: str = "fast"
+    # Gemini response cache (path enables persistence across restarts)
+    gemini_cache_size: int = 256
+    gemini_cache_ttl: float = 300.0
+    gemini_cache_path: Optional[str] = None
+    # Gemini client: pooled connections, deadline per request, retries,
+    # optional hedging after a latency percentile and circuit breaker
+    gemini_deadline: float = 8.0
+    gemini_connect_timeout: float = 3.0
+    gemini_max_connections: int = 10
+    gemini_keepalive_expiry: float = 60.0
+    gemini_max_retries: int = 2
+    gemini_retry_base_delay: float = 0.25
+    gemini_retry_max_delay: float = 2.0
+    gemini_hedge: bool = False
+    gemini_hedge_percentile: float = 0.95
+    gemini_breaker_threshold: int = 5
+    gemini_breaker_reset: float = 30.0
+    # Keep the Rob system instruction in a Gemini cachedContents entry
+    gemini_context_cache: bool = False
+    gemini_context_cache_ttl: int = 3600
+    # Stream text_command replies as assistant_partial messages by default
+    gemini_stream: bool = False
+    # Server-side conversation memory (used when clients omit history)
+    conversation_token_budget: int = 1024
+    conversation_max_turns: int = 40
+    conversation_summarize: bool = False
+    conversation_summary_tokens: int = 256
+    conversation_max_sessions: int = 1000
+    conversation_idle_ttl: float = 1800.0
+    # Local intent matcher for simple on/off/toggle commands (skips Gemini)
+    intent_fast_path: bool = True
+    intent_alias_ttl: float = 60.0
+    # Entity state history (daily partitions, dropped after the retention)
+    history_enabled: bool = True
+    history_retention_days: int = 30
+    history_partitions_ahead: int = 3
+    history_maintenance_interval: float = 3600.0
+    # Voice activity trimming before transcription
+    whisper_vad: bool = True
+    vad_threshold_db: float = -40.0
+    vad_dynamic_range_db: float = 35.0
+    vad_min_pause: float = 0.5
+    vad_padding: float = 0.2
+    vad_max_chunk: float = 30.0
+
     class Config:
         env_file = ".env"
 
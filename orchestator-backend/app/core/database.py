@@ -21,10 +21,11 @@ async def init_db():
     """Create database tables from ORM models (call at startup in development)."""
     from importlib import import_module
 
-    try:
-        import_module("app.models.entity")
-    except Exception:
-        pass
+    for module in ("app.models.entity", "app.models.entity_state_history"):
+        try:
+            import_module(module)
+        except Exception:
+            pass
 
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
@@ -3,9 +3,9 @@ from fastapi import FastAPI
 from app.core.database import init_db
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import system, ha, ws_bridge, ai, entities
+from app.services import ai_service, gemini_client, ha_listener_service, ha_service, history_service, whisper_service
+from app.services.state_writer_service import state_writer
 from app.utils import color_style
-from app import listen_homeassistant
-import app as app_module
 
 app = FastAPI(
     title="Virtual Greeter Backend",
@@ -24,8 +24,8 @@ app.include_router(entities.router, prefix="/api", tags=["Entities"])
 async def startup_event():
     """Start the Home Assistant WebSocket listener when the app starts"""
     # Pass the WebSocket manager to the listen_homeassistant function
-    app_module.ws_manager = ws_bridge.manager
-    asyncio.create_task(listen_homeassistant())
+    ha_listener_service.ws_manager = ws_bridge.manager
+    asyncio.create_task(ha_listener_service.listen_homeassistant())
 
 
 @app.on_event("startup")
@@ -35,6 +35,53 @@ async def on_startup():
     except Exception as e:
         print(f"{color_style.WARNING} init_db failed: {e}")
 
+
+@app.on_event("startup")
+async def start_ha_client():
+    """Open the shared, pooled Home Assistant HTTP client"""
+    await ha_service.start_client()
+
+
+@app.on_event("startup")
+async def start_gemini_client():
+    """Open the shared, pooled Gemini HTTP client"""
+    await gemini_client.start_client()
+
+
+@app.on_event("startup")
+async def start_state_writer():
+    """Start the write-behind flusher for entity state updates"""
+    state_writer.start()
+
+
+@app.on_event("startup")
+async def start_history_maintenance():
+    """Create state history partitions ahead and drop expired ones"""
+    history_service.maintenance.start()
+
+
+@app.on_event("startup")
+async def start_whisper_pool():
+    """Set up the Whisper pool; models load lazily or warm up in the background"""
+    whisper_service.pool.start_lifecycle()
+
+
+@app.on_event("startup")
+async def load_gemini_cache():
+    """Restore persisted Gemini replies (when gemini_cache_path is set)"""
+    ai_service.response_cache.load()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush pending state updates, release pooled connections and stop workers"""
+    await state_writer.stop()
+    await history_service.maintenance.stop()
+    await ha_service.close_client()
+    await gemini_client.close_client()
+    whisper_service.pool.stop()
+    ai_service.response_cache.save()
+
 # CORS middleware to allow requests from Godot
 app.add_middleware(
     CORSMiddleware,
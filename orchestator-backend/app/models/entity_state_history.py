@@ -0,0 +1,33 @@
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime, Float, PrimaryKeyConstraint
+from app.core.database import Base
+
+
+class EntityStateHistory(Base):
+    """Append-only log of entity state changes.
+
+    The table is partitioned by day on `recorded_at` (partitions are created
+    ahead and dropped after the retention period by history_service).
+    `value` holds the state as a number when it is one (on/off as 1/0) so
+    series can be aggregated in SQL.
+    """
+
+    __tablename__ = "entity_state_history"
+    __table_args__ = (
+        # The partition key must be part of the primary key
+        PrimaryKeyConstraint("entity_id", "recorded_at"),
+        {"postgresql_partition_by": "RANGE (recorded_at)"},
+    )
+
+    entity_id = Column(String(255), nullable=False)
+    recorded_at = Column(DateTime, default=datetime.now, nullable=False)
+    state = Column(String(255), nullable=False)
+    value = Column(Float, nullable=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "entity_id": self.entity_id,
+            "recorded_at": self.recorded_at.isoformat() if self.recorded_at else None,
+            "state": self.state,
+            "value": self.value,
+        }
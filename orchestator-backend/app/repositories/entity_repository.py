@@ -1,11 +1,79 @@
 from datetime import datetime
-from typing import List, Optional
-from sqlalchemy import select
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple, Union
+from sqlalchemy import JSON, bindparam, cast, delete, insert, literal, literal_column, select, update
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.entity import Entity
 from app.core.database import AsyncSessionLocal
 
 
+def merge_json(column, patch: Any):
+    """SQL expression for `column || patch`.
+
+    The attributes column is JSON, so both sides are cast to jsonb for the
+    merge and the result back to JSON. `patch` is a dict or an SQL
+    expression (e.g. the EXCLUDED row of an upsert).
+    """
+    patch = literal(patch, JSONB) if isinstance(patch, dict) else cast(patch, JSONB)
+    return cast(cast(column, JSONB).op("||")(patch), JSON)
+
+
+# Lengths of the entities.entity_id and entities.state columns
+MAX_ENTITY_ID_LENGTH = 255
+MAX_STATE_LENGTH = 64
+
+
+def ha_timestamp(value: Any, default: Optional[datetime]) -> Optional[datetime]:
+    """HA ISO timestamp -> naive local datetime, like the rest of the table"""
+    if not value:
+        return default
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def entity_row(item: Any, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Validate one entity in Home Assistant `/states` format into a table row.
+
+    Raises:
+        ValueError: The item is not a valid entity.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("Entity must be a JSON object")
+    entity_id = item.get("entity_id")
+    if not isinstance(entity_id, str) or "." not in entity_id or "\x00" in entity_id:
+        raise ValueError(f"Invalid entity_id: {entity_id!r}")
+    if len(entity_id) > MAX_ENTITY_ID_LENGTH:
+        raise ValueError(f"entity_id longer than {MAX_ENTITY_ID_LENGTH} characters")
+    state = item.get("state")
+    if state is None:
+        raise ValueError("Missing state")
+    state = str(state)
+    if len(state) > MAX_STATE_LENGTH:
+        raise ValueError(f"State longer than {MAX_STATE_LENGTH} characters")
+    if "\x00" in state:
+        raise ValueError("State contains a NUL character")
+    attributes = item.get("attributes") or {}
+    context = item.get("context") or {}
+    if not isinstance(attributes, dict) or not isinstance(context, dict):
+        raise ValueError("attributes and context must be objects")
+
+    now = now or datetime.now()
+    last_changed = ha_timestamp(item.get("last_changed"), now)
+    return {
+        "entity_id": entity_id,
+        "state": state,
+        "attributes": attributes,
+        "last_updated": ha_timestamp(item.get("last_updated"), last_changed),
+        "last_changed": last_changed,
+        "context": context,
+    }
+
+
 class EntityRepository:
     """Repository for Entity CRUD operations"""
 
@@ -13,17 +81,109 @@ class EntityRepository:
         self.session = session
 
     async def create(self, entity_id: str, state: str, attributes: Optional[dict] = None) -> Entity:
-        """Create a new entity"""
-        entity = Entity(
-            entity_id=entity_id,
-            state=state,
-            attributes=attributes or {}
+        """Create a new entity (INSERT ... RETURNING, one round trip)"""
+        result = await self.session.execute(
+            insert(Entity)
+            .values(entity_id=entity_id, state=state, attributes=attributes or {})
+            .returning(Entity)
         )
-        self.session.add(entity)
+        entity = result.scalar_one()
         await self.session.commit()
-        await self.session.refresh(entity)
         return entity
 
+    async def bulk_upsert(
+        self,
+        items: Union[Iterable[Any], AsyncIterable[Any]],
+        chunk_size: int = 500,
+        merge_attributes: bool = False,
+        max_errors: int = 50,
+    ) -> Dict[str, Any]:
+        """Insert or update many entities in one transaction.
+
+        Items are entities in Home Assistant `/states` format (a list, or an
+        async iterator such as a parsed NDJSON upload, which may yield
+        ValueError for lines it could not parse). They are written in
+        multi-row INSERT ... ON CONFLICT DO UPDATE statements of
+        `chunk_size` rows, each inside a savepoint so one bad chunk does not
+        abort the others; a chunk the database rejects is retried row by row
+        so only the offending items fail. Invalid items are skipped and
+        counted as failed.
+
+        Returns:
+            Dict with inserted, updated and failed counts and the first
+            `max_errors` errors.
+        """
+        report: Dict[str, Any] = {"inserted": 0, "updated": 0, "failed": 0, "errors": []}
+
+        def fail(index: Optional[int], entity_id: Any, error: str):
+            report["failed"] += 1
+            if len(report["errors"]) < max_errors:
+                report["errors"].append({"index": index, "entity_id": entity_id, "error": error})
+
+        # Keyed by entity_id: one statement cannot touch the same row twice.
+        # Values are (item index, row).
+        chunk: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        index = 0
+        async for item in iter_async(items):
+            try:
+                if isinstance(item, ValueError):
+                    # Parse error reported by the source (e.g. a bad NDJSON line)
+                    raise item
+                row = entity_row(item)
+            except (ValueError, TypeError) as e:
+                fail(index, item.get("entity_id") if isinstance(item, dict) else None, str(e))
+            else:
+                chunk.pop(row["entity_id"], None)
+                chunk[row["entity_id"]] = (index, row)
+                if len(chunk) >= chunk_size:
+                    await self._upsert_chunk(list(chunk.values()), merge_attributes, report, fail)
+                    chunk = {}
+            index += 1
+        if chunk:
+            await self._upsert_chunk(list(chunk.values()), merge_attributes, report, fail)
+
+        await self.session.commit()
+        return report
+
+    async def _upsert_chunk(
+        self, indexed: List[Tuple[int, Dict[str, Any]]], merge_attributes: bool, report: Dict[str, Any], fail
+    ):
+        try:
+            inserted = await self._upsert_rows([row for _, row in indexed], merge_attributes)
+        except Exception as e:
+            if len(indexed) == 1:
+                index, row = indexed[0]
+                fail(index, row["entity_id"], f"{e.__class__.__name__}: {e}")
+                return
+            # Find the offending rows instead of failing the whole chunk
+            for item in indexed:
+                await self._upsert_chunk([item], merge_attributes, report, fail)
+            return
+        report["inserted"] += sum(1 for flag in inserted if flag)
+        report["updated"] += sum(1 for flag in inserted if not flag)
+
+    async def _upsert_rows(self, rows: List[Dict[str, Any]], merge_attributes: bool) -> List[bool]:
+        """Upsert rows in one statement inside a savepoint; True per inserted row"""
+        stmt = pg_insert(Entity).values(rows)
+        excluded = stmt.excluded
+        # xmax is 0 for a freshly inserted row version, not for an updated one
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Entity.entity_id],
+            set_={
+                "state": excluded.state,
+                "attributes": (
+                    merge_json(Entity.attributes, excluded.attributes)
+                    if merge_attributes else excluded.attributes
+                ),
+                "last_updated": excluded.last_updated,
+                "last_changed": excluded.last_changed,
+                "context": excluded.context,
+            },
+        ).returning(Entity.entity_id, literal_column("(xmax = 0)").label("inserted"))
+        async with self.session.begin_nested():
+            result = await self.session.execute(stmt)
+            return [row.inserted for row in result]
+
     async def get_by_id(self, entity_id: str) -> Optional[Entity]:
         """Get an entity by its ID"""
         result = await self.session.execute(
@@ -32,41 +192,122 @@ class EntityRepository:
         return result.scalar_one_or_none()
 
     async def get_all(self, skip: int = 0, limit: int = 100) -> List[Entity]:
-        """Get all entities with pagination"""
+        """Get all entities with OFFSET pagination (prefer get_page)"""
         result = await self.session.execute(
-            select(Entity).offset(skip).limit(limit)
+            select(Entity).order_by(Entity.entity_id).offset(skip).limit(limit)
         )
         return result.scalars().all()
 
+    async def get_page(self, after: Optional[str] = None, limit: int = 100) -> List[Entity]:
+        """Keyset pagination: the next `limit` entities with entity_id > `after`.
+
+        Uses the primary key index, so every page costs the same no matter
+        how deep it is (unlike OFFSET).
+        """
+        stmt = select(Entity).order_by(Entity.entity_id).limit(limit)
+        if after is not None:
+            stmt = stmt.where(Entity.entity_id > after)
+        result = await self.session.execute(stmt)
+        return result.scalars().all()
+
+    async def get_ids(self) -> Set[str]:
+        """Every entity_id, without loading the rows"""
+        result = await self.session.stream_scalars(select(Entity.entity_id))
+        return {entity_id async for entity_id in result}
+
+    async def stream_all(self, batch_size: int = 500) -> AsyncIterator[Entity]:
+        """Yield all entities in entity_id order from a server-side cursor,
+        fetching `batch_size` rows at a time"""
+        result = await self.session.stream_scalars(
+            select(Entity).order_by(Entity.entity_id),
+            execution_options={"yield_per": batch_size},
+        )
+        async for entity in result:
+            yield entity
+
     async def update(
         self,
         entity_id: str,
         state: Optional[str] = None,
         attributes: Optional[dict] = None
     ) -> Optional[Entity]:
-        """Update an entity"""
-        entity = await self.get_by_id(entity_id)
-        if not entity:
-            return None
+        """Update an entity (UPDATE ... RETURNING, one round trip).
 
+        Attributes are merged into the stored ones in SQL (jsonb ||).
+        """
+        now = datetime.now()
+        values: Dict[str, Any] = {"last_updated": now}
         if state is not None:
-            entity.state = state
-            entity.last_changed = datetime.now()
-
+            values["state"] = state
+            values["last_changed"] = now
         if attributes is not None:
-            entity.attributes.update(attributes)
+            values["attributes"] = merge_json(Entity.attributes, attributes)
 
-        entity.last_updated = datetime.now()
+        result = await self.session.execute(
+            update(Entity)
+            .where(Entity.entity_id == entity_id)
+            .values(**values)
+            .returning(Entity),
+            execution_options={"synchronize_session": False, "populate_existing": True},
+        )
+        entity = result.scalar_one_or_none()
         await self.session.commit()
-        await self.session.refresh(entity)
         return entity
 
-    async def delete(self, entity_id: str) -> bool:
-        """Delete an entity"""
-        entity = await self.get_by_id(entity_id)
-        if not entity:
-            return False
+    async def update_many(self, updates: Dict[str, dict]) -> int:
+        """Update several entities in a single transaction.
+
+        `updates` maps entity_id to a dict with `state`, `attributes` and
+        `last_updated`. Rows are written with one executemany UPDATE by
+        primary key; entity_ids that are not in the table are ignored.
+        Attributes are merged into the stored ones (jsonb ||), like
+        update() and bulk_upsert(merge_attributes=True).
+        """
+        if not updates:
+            return 0
+
+        table = Entity.__table__
+        stmt = (
+            update(table)
+            .where(table.c.entity_id == bindparam("b_entity_id"))
+            .values(
+                state=bindparam("b_state"),
+                attributes=merge_json(table.c.attributes, bindparam("b_attributes", type_=JSON)),
+                last_updated=bindparam("b_last_updated"),
+                last_changed=bindparam("b_last_updated"),
+            )
+        )
+        rows = [
+            {
+                "b_entity_id": entity_id,
+                "b_state": values["state"],
+                "b_attributes": values["attributes"] or {},
+                "b_last_updated": values["last_updated"],
+            }
+            for entity_id, values in updates.items()
+        ]
+        await self.session.execute(stmt, rows)
+        await self.session.commit()
+        return len(rows)
 
-        await self.session.delete(entity)
+    async def delete(self, entity_id: str) -> bool:
+        """Delete an entity (DELETE ... RETURNING, one round trip)"""
+        result = await self.session.execute(
+            delete(Entity)
+            .where(Entity.entity_id == entity_id)
+            .returning(Entity.entity_id),
+            execution_options={"synchronize_session": False},
+        )
+        deleted = result.scalar_one_or_none()
         await self.session.commit()
-        return True
\ No newline at end of file
+        return deleted is not None
+
+
+async def iter_async(items: Union[Iterable[Any], AsyncIterable[Any]]):
+    """Iterate a plain or async iterable with `async for`"""
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
@@ -0,0 +1,173 @@
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Tuple
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.entity_state_history import EntityStateHistory
+
+TABLE = EntityStateHistory.__tablename__
+# Daily partitions are named entity_state_history_YYYYMMDD
+PARTITION_RE = re.compile(rf"^{TABLE}_(\d{{8}})$")
+INSERT_CHUNK = 2000
+
+
+def partition_name(day: date) -> str:
+    return f"{TABLE}_{day:%Y%m%d}"
+
+
+class HistoryRepository:
+    """Repository for the entity state history time series"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def append_many(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert history rows in one multi-row statement.
+
+        `rows` are dicts with entity_id, recorded_at, state and value. A
+        duplicate (entity_id, recorded_at) is skipped.
+        """
+        if not rows:
+            return 0
+        # Chunked to stay well under the 32767 bind parameters per statement
+        for i in range(0, len(rows), INSERT_CHUNK):
+            await self.session.execute(
+                pg_insert(EntityStateHistory).values(rows[i:i + INSERT_CHUNK]).on_conflict_do_nothing()
+            )
+        await self.session.commit()
+        return len(rows)
+
+    async def get_raw(self, entity_id: str, start: datetime, end: datetime, limit: int = 5000) -> List[EntityStateHistory]:
+        """The newest `limit` state changes of an entity in [start, end),
+        returned oldest first"""
+        result = await self.session.execute(
+            select(EntityStateHistory)
+            .where(
+                EntityStateHistory.entity_id == entity_id,
+                EntityStateHistory.recorded_at >= start,
+                EntityStateHistory.recorded_at < end,
+            )
+            .order_by(EntityStateHistory.recorded_at.desc())
+            .limit(limit)
+        )
+        rows = result.scalars().all()
+        rows.reverse()
+        return rows
+
+    async def get_buckets(self, entity_id: str, start: datetime, end: datetime, bucket_seconds: int) -> List[Dict[str, Any]]:
+        """Downsampled series: count/min/max/avg/last per `bucket_seconds` interval.
+
+        Aggregation runs in SQL; only one row per non-empty bucket is
+        returned. Buckets are aligned to the epoch.
+        """
+        epoch = func.extract("epoch", EntityStateHistory.recorded_at)
+        bucket = func.to_timestamp(func.floor(epoch / bucket_seconds) * bucket_seconds)
+        bucket = func.timezone("UTC", bucket).label("bucket")
+        stmt = (
+            select(
+                bucket,
+                func.count().label("count"),
+                func.min(EntityStateHistory.value).label("min"),
+                func.max(EntityStateHistory.value).label("max"),
+                func.avg(EntityStateHistory.value).label("avg"),
+                array_agg(
+                    aggregate_order_by(EntityStateHistory.value, EntityStateHistory.recorded_at.desc())
+                )[1].label("last"),
+                array_agg(
+                    aggregate_order_by(EntityStateHistory.state, EntityStateHistory.recorded_at.desc())
+                )[1].label("last_state"),
+            )
+            .where(
+                EntityStateHistory.entity_id == entity_id,
+                EntityStateHistory.recorded_at >= start,
+                EntityStateHistory.recorded_at < end,
+            )
+            .group_by(text("bucket"))
+            .order_by(text("bucket"))
+        )
+        result = await self.session.execute(stmt)
+        return [dict(row._mapping) for row in result]
+
+    async def ensure_partitions(self, first_day: date, days: int) -> Tuple[List[str], Dict[str, str]]:
+        """Create the daily partitions (and the default one) that are missing.
+
+        Each partition is created in its own savepoint, so one failure does
+        not undo the others. When rows for a day already landed in the
+        default partition (maintenance did not run in time), they are moved
+        into a new table that is then attached as that day's partition.
+
+        Returns:
+            The created partition names and the errors of those that failed.
+        """
+        created = []
+        failed = {}
+        await self.session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {TABLE}_default PARTITION OF {TABLE} DEFAULT"
+        ))
+        existing = set(await self.list_partitions())
+        for offset in range(days):
+            day = first_day + timedelta(days=offset)
+            name = partition_name(day)
+            if name in existing:
+                continue
+            try:
+                async with self.session.begin_nested():
+                    await self._create_partition(name, day)
+            except Exception as e:
+                failed[name] = f"{e.__class__.__name__}: {e}"
+                continue
+            created.append(name)
+        await self.session.commit()
+        return created, failed
+
+    async def _create_partition(self, name: str, day: date):
+        bounds = {
+            "start": datetime.combine(day, datetime.min.time()),
+            "end": datetime.combine(day + timedelta(days=1), datetime.min.time()),
+        }
+        values = f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+        result = await self.session.execute(text(
+            f"SELECT EXISTS (SELECT 1 FROM {TABLE}_default "
+            "WHERE recorded_at >= :start AND recorded_at < :end)"
+        ), bounds)
+        if not result.scalar():
+            await self.session.execute(text(f"CREATE TABLE {name} PARTITION OF {TABLE} {values}"))
+            return
+
+        # The default partition holds rows of this day: CREATE ... PARTITION OF
+        # would fail, so move them into a detached table and attach that
+        await self.session.execute(text(
+            f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        ))
+        await self.session.execute(text(
+            f"WITH moved AS (DELETE FROM {TABLE}_default "
+            "WHERE recorded_at >= :start AND recorded_at < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ), bounds)
+        await self.session.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} {values}"))
+
+    async def list_partitions(self) -> List[str]:
+        result = await self.session.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+            "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+            "WHERE parent.relname = :table"
+        ), {"table": TABLE})
+        return [row[0] for row in result]
+
+    async def drop_partitions_before(self, cutoff: date) -> List[str]:
+        """Drop the daily partitions that only hold data older than `cutoff`"""
+        dropped = []
+        for name in await self.list_partitions():
+            match = PARTITION_RE.match(name)
+            if match and datetime.strptime(match.group(1), "%Y%m%d").date() < cutoff:
+                await self.session.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                dropped.append(name)
+        # Rows that landed in the default partition are trimmed by age
+        await self.session.execute(
+            text(f"DELETE FROM {TABLE}_default WHERE recorded_at < :cutoff"),
+            {"cutoff": datetime.combine(cutoff, datetime.min.time())},
+        )
+        await self.session.commit()
+        return dropped
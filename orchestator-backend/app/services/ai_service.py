@@ -1,43 +1,439 @@
+import asyncio
+import hashlib
 import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
 import httpx
 from fastapi import HTTPException
 from app.core.config import settings
-from app.utils import rob_context, color_style
+from app.services import gemini_client, prompt_service
+from app.utils import color_style
 
-context = rob_context.VIRTUAL_GREETER_CONTEXT
+# Only the latest turns of history take part in the cache key
+CACHE_HISTORY_TURNS = 4
 
-async def ask_gemini(prompt: dict, model: str = "gemini-2.5-flash"):
+# Rob-formatted reply used when Gemini is unavailable (breaker open, deadline hit)
+FALLBACK_REPLY = json.dumps({
+    "comment": "Sorry, I'm having trouble thinking right now. Could you ask me again in a moment?",
+    "instruction": None,
+    "state": None,
+    "suggest": None,
+    "status": "error",
+    "context": {},
+    "fallback": True,
+}, ensure_ascii=False)
+
+
+def _digest(value: Any) -> str:
+    data = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def normalize_dialogue(text: str) -> str:
+    """Lower-case, drop punctuation and collapse whitespace"""
+    text = re.sub(r"[^\w\s]", " ", str(text).lower())
+    return " ".join(text.split())
+
+
+def cache_key(prompt: Dict[str, Any], model: str, entity_state: Optional[Dict[str, Any]] = None) -> str:
+    """Key on (model, entity_id, entity state hash, dialogue, recent-history hash)"""
+    obj = prompt.get("object")
+    entity_id = obj.get("entity_id") if isinstance(obj, dict) else obj
+    state = entity_state if entity_state is not None else (obj if isinstance(obj, dict) else None)
+    state_hash = _digest([state.get("state"), state.get("attributes")]) if state else None
+    history = prompt.get("history") or []
+    return _digest([
+        model,
+        entity_id,
+        state_hash,
+        normalize_dialogue(prompt.get("dialogue", "")),
+        _digest(history[-CACHE_HISTORY_TURNS:]),
+    ])
+
+
+class ResponseCache:
+    """Bounded LRU cache of Gemini replies with a TTL.
+
+    Entries store a wall-clock expiry so they can be persisted to `path`
+    (JSON) at shutdown and loaded back at startup.
+    """
+
+    def __init__(self, max_size: int, ttl: float, path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, text = entry
+        if expires_at < time.time():
+            del self.entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return text
+
+    def put(self, key: str, text: str):
+        self.entries[key] = (time.time() + self.ttl, text)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except Exception as e:
+            print(f"{color_style.WARNING} Could not load Gemini cache from {self.path}: {e}")
+            return
+        now = time.time()
+        for key, (expires_at, text) in stored.items():
+            if expires_at > now:
+                self.entries[key] = (expires_at, text)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        print(f"{color_style.INFO} Loaded {len(self.entries)} cached Gemini replies")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(dict(self.entries), f, ensure_ascii=False)
+        except Exception as e:
+            print(f"{color_style.WARNING} Could not save Gemini cache to {self.path}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+response_cache = ResponseCache(
+    max_size=settings.gemini_cache_size,
+    ttl=settings.gemini_cache_ttl,
+    path=settings.gemini_cache_path,
+)
+
+
+def is_cacheable(text: str) -> bool:
+    """Only cache well-formed, successful replies that don't change device state"""
+    try:
+        reply = json.loads(text)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(reply, dict) and not reply.get("instruction") and reply.get("status") != "error"
+
+
+async def ask_gemini(
+    prompt: dict,
+    model: str = "gemini-2.5-flash",
+    entity_state: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True,
+    usage: Optional[Dict[str, Any]] = None,
+):
+    """Ask Gemini, answering repeated questions from the response cache.
+
+    Args:
+        prompt: Dict with object, dialogue and history.
+        model: Gemini model name.
+        entity_state: Current HA state of the object, part of the cache key.
+        use_cache: False to always call Gemini (stateful instructions).
+        usage: Optional dict filled with the prompt/output token counts.
+    """
+    key = None
+    if use_cache and settings.gemini_cache_size > 0:
+        key = cache_key(prompt, model, entity_state)
+        cached = response_cache.get(key)
+        if cached is not None:
+            print(f"{color_style.LOGGER} Gemini cache hit")
+            return cached
+
+    text = await generate(prompt, model, usage)
+    if key is not None and is_cacheable(text):
+        response_cache.put(key, text)
+    return text
+
+
+class ReplyStream:
+    """Incremental view of a JSON reply while Gemini is still streaming it.
+
+    Tracks the text of the "comment" field as it grows and the
+    "instruction" field as soon as its value is complete, so both can be
+    used before the rest of the JSON has arrived.
+    """
+
+    COMMENT_RE = re.compile(r'"comment"\s*:\s*"')
+    INSTRUCTION_RE = re.compile(r'"instruction"\s*:\s*(null|"(?:[^"\\]|\\.)*")')
+
+    def __init__(self):
+        self.text = ""
+        self.comment = ""
+        self.comment_done = False
+        self.instruction_done = False
+        self.instruction: Optional[str] = None
+
+    def feed(self, delta: str) -> str:
+        """Add a text delta; returns the new part of the comment, if any"""
+        self.text += delta
+        if not self.instruction_done:
+            match = self.INSTRUCTION_RE.search(self.text)
+            if match:
+                self.instruction_done = True
+                self.instruction = json.loads(match.group(1))
+        if self.comment_done:
+            return ""
+        comment = self._comment()
+        new = comment[len(self.comment):]
+        self.comment = comment
+        return new
+
+    def _comment(self) -> str:
+        start = self.COMMENT_RE.search(self.text)
+        if not start:
+            return self.comment
+        raw = self.text[start.end():]
+        end = 0
+        while end < len(raw):
+            if raw[end] == '"':
+                self.comment_done = True
+                break
+            if raw[end] == "\\":
+                size = 6 if raw[end + 1:end + 2] == "u" else 2
+                if end + size > len(raw):
+                    # Escape cut in half by the chunk boundary, wait for the rest
+                    break
+                end += size
+                continue
+            end += 1
+        raw = raw[:end]
+        try:
+            return json.loads(f'"{raw}"', strict=False)
+        except ValueError:
+            return self.comment
+
+
+async def ask_gemini_stream(
+    prompt: dict,
+    model: str = "gemini-2.5-flash",
+    entity_state: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True,
+    on_comment: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    on_instruction: Optional[Callable[[str], Awaitable[None]]] = None,
+    usage: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Streaming variant of ask_gemini.
+
+    Args:
+        prompt, model, entity_state, use_cache, usage: As for ask_gemini.
+        on_comment: Awaited with (delta, comment so far) as the comment grows.
+        on_instruction: Awaited once with the instruction as soon as its
+            JSON field is complete (not called when it is null).
+
+    Returns:
+        The full reply text, like ask_gemini.
+    """
+    key = None
+    if use_cache and settings.gemini_cache_size > 0:
+        key = cache_key(prompt, model, entity_state)
+        cached = response_cache.get(key)
+        if cached is not None:
+            print(f"{color_style.LOGGER} Gemini cache hit")
+            reply = ReplyStream()
+            delta = reply.feed(cached)
+            if delta and on_comment is not None:
+                await on_comment(delta, reply.comment)
+            return cached
+
+    reply = ReplyStream()
+    async for chunk in generate_stream(prompt, model, usage):
+        had_instruction = reply.instruction_done
+        delta = reply.feed(chunk)
+        if delta and on_comment is not None:
+            await on_comment(delta, reply.comment)
+        if reply.instruction_done and not had_instruction and reply.instruction and on_instruction is not None:
+            await on_instruction(reply.instruction)
+
+    text = reply.text
+    print(f"{color_style.LOGGER} Gemini response: {text}")
+    if key is not None and is_cacheable(text):
+        response_cache.put(key, text)
+    return text
+
+
+class ContextCache:
+    """Gemini cachedContents entry holding the system instruction, per model.
+
+    Created on first use and renewed shortly before its TTL runs out. When
+    the API refuses it (e.g. the instruction is below the model's minimum
+    cacheable size) requests fall back to a plain system_instruction and
+    creation is retried later.
+    """
+
+    RETRY_AFTER = 600.0
+
+    def __init__(self, enabled: bool, ttl: int):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.entries: Dict[str, tuple] = {}
+        self.retry_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def _valid(self, model: str) -> Optional[str]:
+        entry = self.entries.get(model)
+        if entry is not None and entry[1] - 60 > time.time():
+            return entry[0]
+        return None
+
+    async def get(self, client: httpx.AsyncClient, model: str) -> Optional[str]:
+        if not self.enabled or time.time() < self.retry_at:
+            return None
+        name = self._valid(model)
+        if name is not None:
+            return name
+        async with self.lock:
+            name = self._valid(model)
+            if name is not None:
+                return name
+            base_url = settings.gemini_base_url.rstrip("/").rsplit("/models", 1)[0]
+            body = {
+                "model": f"models/{model}",
+                "systemInstruction": {"parts": [{"text": prompt_service.SYSTEM_INSTRUCTION}]},
+                "ttl": f"{self.ttl}s",
+            }
+            try:
+                resp = await client.post(
+                    f"{base_url}/cachedContents?key={settings.gemini_api_key}", json=body
+                )
+                resp.raise_for_status()
+                name = resp.json()["name"]
+            except (httpx.HTTPError, KeyError, ValueError) as e:
+                print(f"{color_style.WARNING} Gemini context cache unavailable, using system_instruction: {e}")
+                self.retry_at = time.time() + self.RETRY_AFTER
+                return None
+            self.entries[model] = (name, time.time() + self.ttl)
+            print(f"{color_style.INFO} Gemini context cached as {name}")
+            return name
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "entries": {model: name for model, (name, _) in self.entries.items()},
+        }
+
+
+context_cache = ContextCache(
+    enabled=settings.gemini_context_cache,
+    ttl=settings.gemini_context_cache_ttl,
+)
+
+
+async def _request_body(client: httpx.AsyncClient, prompt: dict, model: str) -> Dict[str, Any]:
+    body = prompt_service.build_body(prompt, await context_cache.get(client, model))
+    print(f"{color_style.LOGGER}{body['contents'][0]['parts'][0]['text']}")
+    return body
+
+
+def _record_usage(metadata: Dict[str, Any], usage: Optional[Dict[str, Any]] = None):
+    """Track Gemini's usageMetadata and report it to the caller"""
+    if not metadata:
+        return
+    prompt_service.usage_stats.record(metadata)
+    print(f"{color_style.LOGGER} Gemini tokens: {metadata}")
+    if usage is not None:
+        usage.update(
+            prompt_tokens=metadata.get("promptTokenCount", 0),
+            cached_tokens=metadata.get("cachedContentTokenCount", 0),
+            output_tokens=metadata.get("candidatesTokenCount", 0),
+        )
+
+
+async def generate_stream(
+    prompt: dict, model: str = "gemini-2.5-flash", usage: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[str]:
+    """Yield the reply text in deltas from Gemini's streamGenerateContent (SSE)"""
+    base_url = settings.gemini_base_url.rstrip("/")
+    url = f"{base_url}/{model}:streamGenerateContent?alt=sse&key={settings.gemini_api_key}"
+    body = await _request_body(gemini_client.get_client(), prompt, model)
+
+    received = False
+    metadata: Dict[str, Any] = {}
+    try:
+        async for line in gemini_client.stream_lines(url, body):
+            if not line.startswith("data:"):
+                continue
+            data = json.loads(line[5:])
+            # Usage is cumulative; the last chunk has the totals
+            metadata = data.get("usageMetadata", metadata)
+            for candidate in data.get("candidates", [])[:1]:
+                for part in candidate.get("content", {}).get("parts", []):
+                    if part.get("text"):
+                        received = True
+                        yield part["text"]
+    except gemini_client.GeminiUnavailable as e:
+        if not received:
+            print(f"{color_style.WARNING} {e}, answering with fallback reply")
+            yield FALLBACK_REPLY
+            return
+        # Part of the reply is already out; a fallback would corrupt it
+        print(f"{color_style.ERROR} {e}")
+        raise HTTPException(status_code=504, detail=f"Gemini stream interrupted: {e}")
+    except httpx.HTTPStatusError as e:
+        print(f"{color_style.ERROR} HTTP error: {str(e)}")
+        raise HTTPException(status_code=e.response.status_code, detail=f"Error llamando Gemini: {e.response.text}")
+
+    _record_usage(metadata, usage)
+    if not received:
+        print(f"{color_style.ERROR} No candidates found in Gemini response")
+        raise HTTPException(status_code=500, detail="No candidates found in Gemini response")
+
+
+async def generate(prompt: dict, model: str = "gemini-2.5-flash", usage: Optional[Dict[str, Any]] = None):
     
     base_url = settings.gemini_base_url.rstrip("/")
     url = f"{base_url}/{model}:generateContent?key={settings.gemini_api_key}"
-    history = prompt.get("history", [])
-    prompt_text = json.dumps(prompt, ensure_ascii=False)
-    print(f"{color_style.LOGGER}{prompt_text}")
-    
-    headers = {
-        "Content-Type": "application/json"
-    }
-    body = {
-        "contents": [
-            {"parts": [{"text": context}]},
-            {"parts": [{"text": prompt_text}]}
-        ]
-    }
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            resp = await client.post(url, headers=headers, json=body)
-            resp.raise_for_status()
-        except httpx.RequestError as e:
-            print(f"{color_style.ERROR} Connection error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error de conexión con Gemini: {e.__class__.__name__} - {str(e)}")
-        except httpx.HTTPStatusError as e:
-            print(f"{color_style.ERROR} HTTP error: {str(e)}")
-            raise HTTPException(status_code=e.response.status_code, detail=f"Error llamando Gemini: {e.response.text}")
-        except Exception as e:
-            print(f"{color_style.ERROR} Unexpected error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
+    body = await _request_body(gemini_client.get_client(), prompt, model)
+    try:
+        resp = await gemini_client.post_json(url, body)
+        resp.raise_for_status()
+    except gemini_client.GeminiUnavailable as e:
+        print(f"{color_style.WARNING} {e}, answering with fallback reply")
+        return FALLBACK_REPLY
+    except httpx.HTTPStatusError as e:
+        print(f"{color_style.ERROR} HTTP error: {str(e)}")
+        raise HTTPException(status_code=e.response.status_code, detail=f"Error llamando Gemini: {e.response.text}")
+    except Exception as e:
+        print(f"{color_style.ERROR} Unexpected error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
     data = resp.json()
+    _record_usage(data.get("usageMetadata"), usage)
     if "candidates" not in data or not data["candidates"]:
         print(f"{color_style.ERROR} No candidates found in Gemini response")
         raise HTTPException(status_code=500, detail="No candidates found in Gemini response")
@@ -0,0 +1,147 @@
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+from app.core.config import settings
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), enough for budgeting"""
+    return len(text) // 4 + 1
+
+
+class Conversation:
+    """Recent turns of one session, kept within a token budget.
+
+    Turns are {"role", "content"} dicts like the history Godot sends. When
+    the budget or the turn limit is exceeded the oldest turns are evicted;
+    with summarization on, their first sentence is folded into a short
+    running summary (itself bounded) instead of being lost entirely.
+    """
+
+    def __init__(self, token_budget: int, max_turns: int, summarize: bool, summary_tokens: int):
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.summarize = summarize
+        self.summary_tokens = summary_tokens
+        self.turns: Deque[Dict[str, str]] = deque()
+        self.tokens = 0
+        self.summary: Deque[str] = deque()
+        self.summary_size = 0
+        self.evicted = 0
+        self.touched_at = time.monotonic()
+
+    def add(self, role: str, content: str):
+        content = str(content).strip()
+        if not content:
+            return
+        self.turns.append({"role": role, "content": content})
+        self.tokens += estimate_tokens(content)
+        # Always keep the newest turn, even if it alone exceeds the budget
+        while len(self.turns) > 1 and (self.tokens > self.token_budget or len(self.turns) > self.max_turns):
+            self._evict()
+        self.touched_at = time.monotonic()
+
+    def _evict(self):
+        turn = self.turns.popleft()
+        self.tokens -= estimate_tokens(turn["content"])
+        self.evicted += 1
+        if not self.summarize:
+            return
+        sentence = turn["content"].split(". ")[0][:160]
+        line = f"{turn['role']}: {sentence}"
+        self.summary.append(line)
+        self.summary_size += estimate_tokens(line)
+        while len(self.summary) > 1 and self.summary_size > self.summary_tokens:
+            self.summary_size -= estimate_tokens(self.summary.popleft())
+
+    def history(self) -> List[Dict[str, str]]:
+        """Turns to send to Gemini, preceded by the summary of evicted ones"""
+        self.touched_at = time.monotonic()
+        history = list(self.turns)
+        if self.summary:
+            history.insert(0, {
+                "role": "summary",
+                "content": "Earlier in this conversation: " + " | ".join(self.summary),
+            })
+        return history
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "turns": len(self.turns),
+            "tokens": self.tokens,
+            "summary_tokens": self.summary_size,
+            "evicted": self.evicted,
+        }
+
+
+class ConversationMemory:
+    """Per-session conversations, bounded in count and expired when idle"""
+
+    def __init__(
+        self,
+        token_budget: int,
+        max_turns: int,
+        summarize: bool,
+        summary_tokens: int,
+        max_sessions: int,
+        idle_ttl: float,
+    ):
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.summarize = summarize
+        self.summary_tokens = summary_tokens
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.sessions: "OrderedDict[str, Conversation]" = OrderedDict()
+
+    def _expire(self):
+        now = time.monotonic()
+        while self.sessions:
+            session_id, conversation = next(iter(self.sessions.items()))
+            if now - conversation.touched_at < self.idle_ttl:
+                break
+            del self.sessions[session_id]
+
+    def get(self, session_id: str) -> Optional[Conversation]:
+        self._expire()
+        conversation = self.sessions.get(session_id)
+        if conversation is not None:
+            self.sessions.move_to_end(session_id)
+        return conversation
+
+    def history(self, session_id: str) -> List[Dict[str, str]]:
+        conversation = self.get(session_id)
+        return conversation.history() if conversation is not None else []
+
+    def add(self, session_id: str, role: str, content: str):
+        conversation = self.get(session_id)
+        if conversation is None:
+            conversation = Conversation(
+                self.token_budget, self.max_turns, self.summarize, self.summary_tokens
+            )
+            self.sessions[session_id] = conversation
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        conversation.add(role, content)
+
+    def clear(self, session_id: str):
+        self.sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        self._expire()
+        return {
+            "sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "token_budget": self.token_budget,
+            "tokens": sum(c.tokens for c in self.sessions.values()),
+        }
+
+
+memory = ConversationMemory(
+    token_budget=settings.conversation_token_budget,
+    max_turns=settings.conversation_max_turns,
+    summarize=settings.conversation_summarize,
+    summary_tokens=settings.conversation_summary_tokens,
+    max_sessions=settings.conversation_max_sessions,
+    idle_ttl=settings.conversation_idle_ttl,
+)
@@ -1,10 +1,13 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple, Union
 from fastapi import Depends
-from app.core.database import engine
+from app.core.database import engine, AsyncSessionLocal
 from sqlalchemy import text
 from app.core.database import get_db
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.repositories.entity_repository import EntityRepository
+from app.repositories.entity_repository import EntityRepository, iter_async
+from app.repositories.history_repository import HistoryRepository
+from app.services import ha_service
 from app.schemas.entity import (
     EntityCreate,
     EntityUpdate,
@@ -12,6 +15,11 @@ from app.schemas.entity import (
     EntityInDB,
 )
 
+# entity_ids the HA listener persists; loaded at startup and kept current
+# by the create, bulk and delete paths below
+tracked_entity_ids: Set[str] = set()
+
+
 async def test_connection():
     async with engine.begin() as conn:
         result = await conn.execute(text("SELECT 1"))
@@ -29,6 +37,44 @@ async def get_entities(
     return [EntityResponse.model_validate(entity) for entity in entities]
 
 
+async def get_entities_page(
+    after: Optional[str],
+    limit: int,
+    db: AsyncSession,
+) -> Tuple[List[EntityResponse], Optional[str]]:
+    """One keyset page of entities and the cursor of the next page (None at the end)"""
+    repo = EntityRepository(db)
+    entities = await repo.get_page(after=after, limit=limit)
+    next_cursor = entities[-1].entity_id if len(entities) == limit else None
+    return [EntityResponse.model_validate(entity) for entity in entities], next_cursor
+
+
+async def get_entity_ids(db: AsyncSession) -> Set[str]:
+    """All entity_ids in the table"""
+    repo = EntityRepository(db)
+    return await repo.get_ids()
+
+
+async def refresh_tracked_entity_ids(db: AsyncSession) -> Set[str]:
+    """Reload tracked_entity_ids from the table (in place, so holders see it)"""
+    ids = await get_entity_ids(db)
+    tracked_entity_ids.clear()
+    tracked_entity_ids.update(ids)
+    return tracked_entity_ids
+
+
+async def stream_entities(batch_size: int = 500) -> AsyncIterator[EntityResponse]:
+    """Yield every entity from a server-side cursor.
+
+    Opens its own session so it can outlive the request handler (e.g. as
+    the body of a StreamingResponse).
+    """
+    async with AsyncSessionLocal() as db:
+        repo = EntityRepository(db)
+        async for entity in repo.stream_all(batch_size=batch_size):
+            yield EntityResponse.model_validate(entity)
+
+
 async def create_entity(
     entity_in: EntityCreate,
     db: AsyncSession,
@@ -39,6 +85,7 @@ async def create_entity(
         state=entity_in.state,
         attributes=entity_in.attributes,
     )
+    tracked_entity_ids.add(entity.entity_id)
     return EntityResponse.model_validate(entity)
 
 
@@ -66,6 +113,85 @@ async def update_entity(
     return EntityResponse.model_validate(updated)
 
 
+async def update_entities(updates: Dict[str, dict], db: AsyncSession) -> int:
+    """Apply a batch of state updates in one transaction"""
+    repo = EntityRepository(db)
+    return await repo.update_many(updates)
+
+
+async def _only_domains(items, domains: List[str]):
+    async for item in iter_async(items):
+        # Parse errors are passed on so they get reported
+        if not isinstance(item, dict) or str(item.get("entity_id", "")).split(".")[0] in domains:
+            yield item
+
+
+async def bulk_upsert_entities(
+    items: Union[Iterable[Any], AsyncIterable[Any]],
+    db: AsyncSession,
+    chunk_size: int = 500,
+    merge_attributes: bool = False,
+    domains: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Insert or update many entities (HA `/states` format) in one transaction"""
+    repo = EntityRepository(db)
+    if domains:
+        items = _only_domains(items, domains)
+    report = await repo.bulk_upsert(items, chunk_size=chunk_size, merge_attributes=merge_attributes)
+    if report["inserted"]:
+        # Start persisting HA changes of the new entities without a restart
+        await refresh_tracked_entity_ids(db)
+    return report
+
+
+async def import_ha_entities(
+    db: AsyncSession,
+    domains: Optional[List[str]] = None,
+    chunk_size: int = 500,
+    merge_attributes: bool = False,
+) -> Dict[str, Any]:
+    """Upsert the entities currently in Home Assistant, optionally only some domains"""
+    states = await ha_service.fetch_states()
+    return await bulk_upsert_entities(states, db, chunk_size, merge_attributes, domains)
+
+
+async def append_history(rows: List[Dict[str, Any]], db: AsyncSession) -> int:
+    """Append a batch of state history rows in one statement"""
+    repo = HistoryRepository(db)
+    return await repo.append_many(rows)
+
+
+async def get_entity_history(
+    entity_id: str,
+    start: datetime,
+    end: datetime,
+    db: AsyncSession,
+    bucket_seconds: Optional[int] = None,
+    limit: int = 5000,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """Raw state changes, or per-bucket count/min/max/avg/last when bucketed.
+
+    Returns the points and whether older raw points were cut off by `limit`
+    (the newest ones are always kept).
+    """
+    repo = HistoryRepository(db)
+    if bucket_seconds:
+        rows = await repo.get_buckets(entity_id, start, end, bucket_seconds)
+        return [{**row, "bucket": row["bucket"].isoformat()} for row in rows], False
+    # One extra row tells whether the window holds more than `limit`
+    rows = await repo.get_raw(entity_id, start, end, limit + 1)
+    truncated = len(rows) > limit
+    if truncated:
+        rows = rows[1:]
+    points = [
+        {"recorded_at": row.recorded_at.isoformat(), "state": row.state, "value": row.value}
+        for row in rows
+    ]
+    return points, truncated
+
+
 async def delete_entity(entity_id: str, db: AsyncSession) -> bool:
     repo = EntityRepository(db)
-    return await repo.delete(entity_id)
\ No newline at end of file
+    deleted = await repo.delete(entity_id)
+    tracked_entity_ids.discard(entity_id)
+    return deleted
\ No newline at end of file
@@ -0,0 +1,346 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+import httpx
+from app.core.config import settings
+from app.utils import color_style
+
+# Upstream overload / outage statuses worth retrying
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Shared client, created at startup and closed at shutdown (see main.py)
+http_client: Optional[httpx.AsyncClient] = None
+
+
+class GeminiUnavailable(Exception):
+    """Gemini could not answer within the deadline, or the breaker is open"""
+
+
+def _build_client() -> httpx.AsyncClient:
+    """Build a pooled keep-alive client configured from settings"""
+    return httpx.AsyncClient(
+        headers={"Content-Type": "application/json"},
+        timeout=httpx.Timeout(settings.gemini_deadline, connect=settings.gemini_connect_timeout),
+        limits=httpx.Limits(
+            max_connections=settings.gemini_max_connections,
+            max_keepalive_connections=settings.gemini_max_connections,
+            keepalive_expiry=settings.gemini_keepalive_expiry,
+        ),
+    )
+
+
+async def start_client():
+    """Create the shared Gemini client (call at startup)"""
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = _build_client()
+        print(f"{color_style.INFO} Gemini HTTP client started")
+
+
+async def close_client():
+    """Close the shared Gemini client (call at shutdown)"""
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+        print(f"{color_style.INFO} Gemini HTTP client closed")
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily if startup did not run"""
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = _build_client()
+    return http_client
+
+
+class CircuitBreaker:
+    """Stops calling Gemini after repeated failures.
+
+    closed: requests go through; `failure_threshold` consecutive failures
+    open it. open: requests are refused until `reset_timeout` elapses.
+    half_open: a single probe request is let through; its success closes
+    the breaker, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.rejected = 0
+        self.trips = 0
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self.probing = False
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        if self.state == "closed":
+            return True
+        self.rejected += 1
+        return False
+
+    def release(self):
+        """Give up a request without a verdict (e.g. cancelled by the caller)"""
+        self.probing = False
+
+    def success(self):
+        if self.state != "closed":
+            print(f"{color_style.INFO} Gemini circuit breaker closed")
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.trips += 1
+                print(f"{color_style.WARNING} Gemini circuit breaker open after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        retry_in = None
+        if self.state == "open":
+            retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "retry_in": retry_in,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+class LatencyTracker:
+    """Recent successful request latencies, for the hedging delay"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+breaker = CircuitBreaker(
+    failure_threshold=settings.gemini_breaker_threshold,
+    reset_timeout=settings.gemini_breaker_reset,
+)
+latency = LatencyTracker()
+counters = {"requests": 0, "retries": 0, "hedged": 0, "hedge_wins": 0, "deadline_exceeded": 0}
+
+
+def _backoff(attempt: int, response: Optional[httpx.Response]) -> float:
+    """Full-jitter exponential backoff, or the server's Retry-After when given"""
+    if response is not None:
+        try:
+            return float(response.headers["retry-after"])
+        except (KeyError, ValueError):
+            pass
+    return random.uniform(0, min(settings.gemini_retry_max_delay, settings.gemini_retry_base_delay * 2 ** attempt))
+
+
+async def _hedged(send: Callable[[float], Awaitable[httpx.Response]], timeout: float) -> httpx.Response:
+    """Send once; if no answer after the latency percentile, send a second
+    copy and keep whichever answers first"""
+    delay = latency.percentile(settings.gemini_hedge_percentile) if settings.gemini_hedge else None
+    if delay is None or delay >= timeout:
+        return await send(timeout)
+
+    first = asyncio.create_task(send(timeout))
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+
+    counters["hedged"] += 1
+    second = asyncio.create_task(send(timeout - delay))
+    pending = {first, second}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # A retryable 5xx only wins once the other attempt has failed too
+            for task in done:
+                if task.exception() is None and task.result().status_code not in RETRY_STATUS:
+                    if task is second:
+                        counters["hedge_wins"] += 1
+                    return task.result()
+        # Neither answered usefully: prefer a retryable response over an error
+        for task in (first, second):
+            if task.exception() is None:
+                return task.result()
+        return first.result()
+    finally:
+        for task in (first, second):
+            if not task.done():
+                task.cancel()
+
+
+async def _with_retries(send: Callable[[float], Awaitable[httpx.Response]]) -> httpx.Response:
+    """Run send(timeout) within the deadline budget, retrying overload and
+    transport errors with jittered backoff and feeding the circuit breaker.
+
+    The deadline is a wall-clock budget for all attempts, hedges and
+    backoff sleeps together. Every outcome settles the breaker, so a
+    half-open probe is never left pending.
+    """
+    if not breaker.allow():
+        raise GeminiUnavailable("Gemini circuit breaker is open")
+
+    counters["requests"] += 1
+    deadline = time.monotonic() + settings.gemini_deadline
+    try:
+        async with asyncio.timeout(settings.gemini_deadline):
+            return await _attempts(send, deadline)
+    except TimeoutError:
+        breaker.failure()
+        counters["deadline_exceeded"] += 1
+        raise GeminiUnavailable(f"Gemini did not answer within {settings.gemini_deadline}s")
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    except GeminiUnavailable:
+        raise
+    except BaseException:
+        breaker.failure()
+        raise
+
+
+async def _attempts(send: Callable[[float], Awaitable[httpx.Response]], deadline: float) -> httpx.Response:
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        started = time.monotonic()
+        response = None
+        try:
+            response = await send(remaining)
+        except httpx.TransportError as e:
+            error = f"{e.__class__.__name__}: {e}"
+        else:
+            if response.status_code not in RETRY_STATUS:
+                # Other 4xx are our fault, not an upstream health problem
+                breaker.success()
+                latency.record(time.monotonic() - started)
+                return response
+            error = f"HTTP {response.status_code}"
+            await response.aclose()
+
+        attempt += 1
+        delay = _backoff(attempt, response)
+        if attempt > settings.gemini_max_retries or time.monotonic() + delay >= deadline:
+            breaker.failure()
+            if time.monotonic() + delay >= deadline:
+                counters["deadline_exceeded"] += 1
+            raise GeminiUnavailable(f"Gemini failed after {attempt} attempts: {error}")
+        counters["retries"] += 1
+        print(f"{color_style.WARNING} Gemini {error}, retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+
+def _timeout(remaining: float) -> httpx.Timeout:
+    return httpx.Timeout(remaining, connect=min(remaining, settings.gemini_connect_timeout))
+
+
+async def post_json(url: str, body: Dict[str, Any]) -> httpx.Response:
+    """POST with deadline, retries, optional hedging and the circuit breaker.
+
+    Raises:
+        GeminiUnavailable: Breaker open, retries exhausted or deadline hit.
+    """
+    client = get_client()
+
+    async def send(remaining: float) -> httpx.Response:
+        return await _hedged(
+            lambda timeout: client.post(url, json=body, timeout=_timeout(timeout)), remaining
+        )
+
+    return await _with_retries(send)
+
+
+async def open_stream(url: str, body: Dict[str, Any]) -> httpx.Response:
+    """Like post_json but returns a streaming response (not hedged).
+
+    Retries only happen before the body is read. The caller must close the
+    response (`await response.aclose()`); prefer stream_lines, which also
+    keeps the body within the deadline.
+    """
+    client = get_client()
+
+    async def send(remaining: float) -> httpx.Response:
+        request = client.build_request("POST", url, json=body, timeout=_timeout(remaining))
+        return await client.send(request, stream=True)
+
+    return await _with_retries(send)
+
+
+async def stream_lines(url: str, body: Dict[str, Any]) -> AsyncIterator[str]:
+    """POST and yield the response body line by line (for SSE).
+
+    The whole exchange, body included, shares one gemini_deadline budget.
+    A stream that stalls past it or breaks mid-way counts as a breaker
+    failure.
+
+    Raises:
+        GeminiUnavailable: As for open_stream, or the stream stalled or broke.
+        httpx.HTTPStatusError: Gemini refused the request (4xx).
+    """
+    deadline = time.monotonic() + settings.gemini_deadline
+    response = await open_stream(url, body)
+    try:
+        try:
+            if response.is_error:
+                await _before(deadline, response.aread())
+            response.raise_for_status()
+            lines = response.aiter_lines()
+            while True:
+                try:
+                    line = await _before(deadline, lines.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield line
+        except TimeoutError:
+            breaker.failure()
+            counters["deadline_exceeded"] += 1
+            raise GeminiUnavailable(f"Gemini stream did not finish within {settings.gemini_deadline}s")
+        except httpx.RequestError as e:
+            breaker.failure()
+            raise GeminiUnavailable(f"Gemini stream broke: {e.__class__.__name__}: {e}")
+    finally:
+        await response.aclose()
+
+
+async def _before(deadline: float, work: Awaitable):
+    """Await work, raising TimeoutError once the deadline has passed"""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        if asyncio.iscoroutine(work):
+            work.close()
+        raise TimeoutError
+    return await asyncio.wait_for(work, remaining)
+
+
+def stats() -> Dict[str, Any]:
+    p50 = latency.percentile(0.5)
+    hedge_after = latency.percentile(settings.gemini_hedge_percentile)
+    return {
+        "breaker": breaker.stats(),
+        **counters,
+        "latency_p50_ms": round(p50 * 1000) if p50 is not None else None,
+        "hedge_after_ms": round(hedge_after * 1000) if settings.gemini_hedge and hedge_after is not None else None,
+    }
@@ -0,0 +1,100 @@
+"""Home Assistant WebSocket listener.
+
+Kept out of app/__init__.py so that importing any app module (e.g. the
+Whisper worker in a spawned process) does not pull in settings, the
+database engine and the HA clients.
+"""
+import json
+import websockets
+from app.utils import color_style
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services import db_service, ha_service
+from app.services.state_cache_service import state_cache
+from app.services.state_writer_service import state_writer
+from datetime import datetime
+
+ws_url = settings.ha_websocket_url
+token = settings.ha_token
+
+# Set by the startup event in main.py
+ws_manager = None
+
+
+async def listen_homeassistant():
+    """Listen to Home Assistant WebSocket events and sync with DB entities."""
+    # Load tracked entities from DB service
+    async with AsyncSessionLocal() as db:
+        # Only the entity_ids are needed for filtering, all of them. The set
+        # is shared with db_service, which adds entities created later.
+        tracked_entity_ids = await db_service.refresh_tracked_entity_ids(db)
+        print(f"{color_style.INFO} Tracking {len(tracked_entity_ids)} entities from DB")
+    
+    async with websockets.connect(ws_url, ssl=True) as ws:
+        # Wait for auth request
+        auth_message = await ws.recv()
+        print(f"{color_style.LOGGER} Auth message: {auth_message}")
+
+        # Send the authentication token
+        await ws.send(json.dumps({
+            "type": "auth",
+            "access_token": token
+        }))
+
+        # Wait for confirmation
+        auth_ok = await ws.recv()
+        print(f"{color_style.LOGGER} Auth OK: {auth_ok}")
+
+        # Subscribe to state change events
+        await ws.send(json.dumps({
+            "id": 1,
+            "type": "subscribe_events",
+            "event_type": "state_changed"
+        }))
+
+        # Seed the state cache after subscribing so no change is missed
+        try:
+            await ha_service.refresh_state_cache(force=True)
+            state_cache.live = True
+        except Exception as e:
+            print(f"{color_style.WARNING} Could not seed state cache: {e}")
+
+        print(f"{color_style.INFO} Listening for state changes...")
+
+        try:
+            while True:
+                msg = await ws.recv()
+                event = json.loads(msg)
+
+                if event.get("type") == "event":
+                    entity_id = event["event"]["data"]["entity_id"]
+                    new_state = event["event"]["data"]["new_state"]
+                    if state_cache.seeded_at is not None:
+                        state_cache.apply_event(entity_id, new_state)
+
+                    # Only process entities that are tracked in the DB
+                    if entity_id in tracked_entity_ids:
+                        print(f"{color_style.INFO} {entity_id} changed to: {new_state['state']}")
+                    
+                        # Persist through the write-behind queue so the receive loop never waits on the DB
+                        state_writer.enqueue(
+                            entity_id,
+                            new_state.get("state"),
+                            new_state.get("attributes", {}),
+                            new_state.get("last_updated") or new_state.get("last_changed"),
+                        )
+
+                        # Broadcast state change to all connected WebSocket clients
+                        if ws_manager:
+                            await ws_manager.broadcast({
+                                "type": "entity_state_changed",
+                                "data": {
+                                    "entity_id": entity_id,
+                                    "state": new_state.get("state"),
+                                    "attributes": new_state.get("attributes", {}),
+                                    "timestamp": datetime.now().isoformat()
+                                }
+                            })
+                            print(f"{color_style.LOGGER} Broadcasted state change for {entity_id} to WebSocket clients")
+        finally:
+            state_cache.live = False
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException
 import requests
 import httpx
-from collections import defaultdict
+from typing import Optional
 from app.core.config import settings
 from app.utils import color_style
+from app.services.state_cache_service import state_cache
 
 url = f"{settings.ha_url}"
 headers = {
@@ -11,115 +12,154 @@ headers = {
     "Content-Type": "application/json",
 }
 
+# Shared client, created at startup and closed at shutdown (see main.py)
+http_client: Optional[httpx.AsyncClient] = None
 
-async def get_ha_devices():
 
-    async with httpx.AsyncClient() as client:
+def _build_client() -> httpx.AsyncClient:
+    """Build a pooled keep-alive client configured from settings"""
+    http2 = settings.ha_http2
+    if http2:
         try:
-            response = await client.get(f"{url}/states", headers=headers)
-            response.raise_for_status()
-        except httpx.RequestError as e:
-            print(f"{color_style.ERROR} Connection error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Connection error: {str(e)}")
-        except httpx.HTTPStatusError as e:
-            print(f"{color_style.ERROR} HTTP error: {str(e)}")
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail="Error fetching data from Home Assistant",
-            )
-
-    entities = response.json()
-    grouped = defaultdict(list)
-
-    for entity in entities:
-        domain = entity["entity_id"].split(".")[0]
-        grouped[domain].append(entity)
-
-    # Convert to list of dicts
-    result = [{"domain": domain, "entities": objs} for domain, objs in grouped.items()]
-    return result
-
-
-async def get_ha_device(entity_id):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{url}/states/{entity_id}", headers=headers)
-            response.raise_for_status()
-        except httpx.RequestError as e:
-            print(f"{color_style.ERROR} Connection error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Connection error: {str(e)}")
-        except httpx.HTTPStatusError as e:
-            print(f"{color_style.ERROR} HTTP error: {str(e)}")
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail="Error fetching data from Home Assistant",
-            )
+            import h2  # noqa: F401
+        except ImportError:
+            print(f"{color_style.WARNING} HTTP/2 requested but 'h2' is not installed, using HTTP/1.1")
+            http2 = False
+
+    return httpx.AsyncClient(
+        headers=headers,
+        http2=http2,
+        timeout=httpx.Timeout(settings.ha_timeout, connect=settings.ha_connect_timeout),
+        limits=httpx.Limits(
+            max_connections=settings.ha_max_connections,
+            max_keepalive_connections=settings.ha_max_keepalive_connections,
+            keepalive_expiry=settings.ha_keepalive_expiry,
+        ),
+    )
+
+
+async def start_client():
+    """Create the shared Home Assistant client (call at startup)"""
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = _build_client()
+        print(f"{color_style.INFO} Home Assistant HTTP client started")
+
+
+async def close_client():
+    """Close the shared Home Assistant client (call at shutdown)"""
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+        print(f"{color_style.INFO} Home Assistant HTTP client closed")
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily if startup did not run"""
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = _build_client()
+    return http_client
+
+
+async def fetch_states():
+    """Download the full `/states` dump from Home Assistant"""
+    client = get_client()
+    try:
+        response = await client.get(f"{url}/states")
+        response.raise_for_status()
+    except httpx.RequestError as e:
+        print(f"{color_style.ERROR} Connection error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Connection error: {str(e)}")
+    except httpx.HTTPStatusError as e:
+        print(f"{color_style.ERROR} HTTP error: {str(e)}")
+        raise HTTPException(
+            status_code=e.response.status_code,
+            detail="Error fetching data from Home Assistant",
+        )
 
     return response.json()
 
 
-async def get_ha_devices_by_domain(domain: str):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{url}/states", headers=headers)
-            response.raise_for_status()
-        except httpx.RequestError as e:
-            print(f"{color_style.ERROR} Connection error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Connection error: {str(e)}")
-        except httpx.HTTPStatusError as e:
-            print(f"{color_style.ERROR} HTTP error: {str(e)}")
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail="Error fetching data from Home Assistant",
-            )
-
-    entities = response.json()
-    filtered_entities = [
-        entity for entity in entities if entity["entity_id"].startswith(f"{domain}.")
-    ]
-
-    return filtered_entities
+async def refresh_state_cache(force: bool = False):
+    """Seed the state cache from `/states` when it is stale or when forced"""
+    seeded_at = state_cache.seeded_at
+    async with state_cache.lock:
+        # Another request may have refreshed while we waited for the lock
+        if state_cache.seeded_at != seeded_at and not state_cache.is_stale():
+            state_cache.record(hit=True)
+            return state_cache
+        if force or state_cache.is_stale():
+            state_cache.record(hit=False)
+            state_cache.seed(await fetch_states())
+            print(f"{color_style.LOGGER} State cache seeded with {len(state_cache.states)} entities")
+        else:
+            state_cache.record(hit=True)
+    return state_cache
+
+
+async def get_ha_devices(refresh: bool = False):
+    cache = await refresh_state_cache(force=refresh)
+    return cache.grouped()
+
+
+async def get_ha_device(entity_id, refresh: bool = False):
+    state_cache.record(hit=not refresh and not state_cache.is_stale())
+    if not refresh and not state_cache.is_stale():
+        cached = state_cache.get(entity_id)
+        if cached is not None:
+            return cached
+        # A fresh cache holds every entity, so a miss means it does not exist
+        raise HTTPException(status_code=404, detail=f"Entity {entity_id} not found")
+
+    client = get_client()
+    try:
+        response = await client.get(f"{url}/states/{entity_id}")
+        response.raise_for_status()
+    except httpx.RequestError as e:
+        print(f"{color_style.ERROR} Connection error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Connection error: {str(e)}")
+    except httpx.HTTPStatusError as e:
+        print(f"{color_style.ERROR} HTTP error: {str(e)}")
+        raise HTTPException(
+            status_code=e.response.status_code,
+            detail="Error fetching data from Home Assistant",
+        )
+
+    entity = response.json()
+    state_cache.set(entity)
+    return entity
+
+
+async def get_ha_devices_by_domain(domain: str, refresh: bool = False):
+    cache = await refresh_state_cache(force=refresh)
+    return cache.get_domain(domain)
 
 
 async def change_ha_entity_state(entity_id: str, new_state: str):
     payload = {"entity_id": entity_id}
     domain = entity_id.split(".")[0]
-    service = new_state.lower() == "on" and "turn_on" or "turn_off"
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{url}/services/{domain}/{service}", headers=headers, json=payload
-            )
-            response.raise_for_status()
-        except httpx.RequestError as e:
-            print(f"{color_style.ERROR} Connection error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Connection error: {str(e)}")
-        except httpx.HTTPStatusError as e:
-            print(f"{color_style.ERROR} HTTP error: {str(e)}")
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail=f"Error changing entity state in Home Assistant {e.response.text}",
-            )
+    # Accept both plain states ("on") and Gemini instructions ("turn_on")
+    service = new_state.lower() in ("on", "turn_on") and "turn_on" or "turn_off"
+    client = get_client()
+    try:
+        response = await client.post(
+            f"{url}/services/{domain}/{service}", json=payload
+        )
+        response.raise_for_status()
+    except httpx.RequestError as e:
+        print(f"{color_style.ERROR} Connection error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Connection error: {str(e)}")
+    except httpx.HTTPStatusError as e:
+        print(f"{color_style.ERROR} HTTP error: {str(e)}")
+        raise HTTPException(
+            status_code=e.response.status_code,
+            detail=f"Error changing entity state in Home Assistant {e.response.text}",
+        )
     return response.json()
 
 
-async def get_single_ha_device(domain: str):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{url}/states", headers=headers)
-            response.raise_for_status()
-        except httpx.RequestError as e:
-            print(f"{color_style.ERROR} Connection error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Connection error: {str(e)}")
-        except httpx.HTTPStatusError as e:
-            print(f"{color_style.ERROR} HTTP error: {str(e)}")
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail="Error fetching data from Home Assistant",
-            )
-
-    entities = response.json()
-    filtered_entities = [
-        entity for entity in entities if entity["entity_id"].startswith(f"{domain}.")
-    ]
-    return filtered_entities
+async def get_single_ha_device(domain: str, refresh: bool = False):
+    cache = await refresh_state_cache(force=refresh)
+    return cache.get_domain(domain)
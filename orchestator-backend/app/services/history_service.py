@@ -0,0 +1,107 @@
+import asyncio
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.repositories.history_repository import HistoryRepository
+from app.utils import color_style
+
+# States charted as 1/0 besides plain numbers
+BINARY_STATES = {"on": 1.0, "off": 0.0, "open": 1.0, "closed": 0.0, "true": 1.0, "false": 0.0}
+
+INTERVAL_RE = re.compile(r"^(\d+)\s*([smhd]?)$")
+INTERVAL_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def numeric_value(state: Any) -> Optional[float]:
+    """State as a number for aggregation, or None (e.g. 'unavailable')"""
+    text = str(state).strip().lower()
+    if text in BINARY_STATES:
+        return BINARY_STATES[text]
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    # NaN/inf would poison min/max/avg
+    return value if value == value and abs(value) != float("inf") else None
+
+
+def history_row(entity_id: str, state: Any, recorded_at: Optional[datetime] = None) -> Dict[str, Any]:
+    state = "" if state is None else str(state)
+    return {
+        "entity_id": entity_id,
+        "recorded_at": recorded_at or datetime.now(),
+        "state": state[:255],
+        "value": numeric_value(state),
+    }
+
+
+def parse_interval(value: str) -> int:
+    """'300', '30s', '5m', '1h', '1d' -> seconds
+
+    Raises:
+        ValueError: Not a positive interval.
+    """
+    match = INTERVAL_RE.match(str(value).strip().lower())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid interval: {value!r} (use e.g. 30s, 5m, 1h, 1d)")
+    return int(match.group(1)) * INTERVAL_UNITS[match.group(2)]
+
+
+class HistoryMaintenance:
+    """Creates upcoming daily partitions and drops expired ones periodically"""
+
+    def __init__(self, retention_days: int, partitions_ahead: int, interval: float):
+        self.retention_days = retention_days
+        self.partitions_ahead = partitions_ahead
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.last_run: Optional[datetime] = None
+
+    async def run_once(self):
+        today = date.today()
+        created, dropped = [], []
+        async with AsyncSessionLocal() as db:
+            repo = HistoryRepository(db)
+            try:
+                created, failed = await repo.ensure_partitions(today - timedelta(days=1), self.partitions_ahead + 2)
+                for name, error in failed.items():
+                    print(f"{color_style.WARNING} Could not create history partition {name}: {error}")
+            except Exception as e:
+                await db.rollback()
+                print(f"{color_style.WARNING} History partition creation failed: {e}")
+            # Retention runs even when partitions could not be created
+            if self.retention_days > 0:
+                dropped = await repo.drop_partitions_before(today - timedelta(days=self.retention_days))
+        self.last_run = datetime.now()
+        if created or dropped:
+            print(f"{color_style.INFO} History partitions created: {created}, dropped: {dropped}")
+
+    async def run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"{color_style.WARNING} History maintenance failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if settings.history_enabled and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+maintenance = HistoryMaintenance(
+    retention_days=settings.history_retention_days,
+    partitions_ahead=settings.history_partitions_ahead,
+    interval=settings.history_maintenance_interval,
+)
@@ -0,0 +1,221 @@
+import re
+import time
+import unicodedata
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.services import db_service
+from app.utils import color_style
+
+# Domains whose turn_on / turn_off services can be called directly
+CONTROLLABLE_DOMAINS = {
+    "light", "switch", "fan", "input_boolean", "media_player", "climate", "humidifier",
+}
+
+# Imperative rules per action (English and Spanish), on normalized text. They
+# are anchored to the start of the sentence, after an optional polite prefix,
+# so reported or embedded commands ("I forgot to turn off...") don't match.
+ACTION_RULES = {
+    "turn_on": [
+        r"^(?:turn|switch|power) on\b",
+        r"^(?:turn|switch|power) (?:\w+ ){1,4}on$",
+        r"^(?:enciende|encender|encienda|prende|prender|prenda|activa|activar|active)\b",
+    ],
+    "turn_off": [
+        r"^(?:turn|switch|power) off\b",
+        r"^(?:turn|switch|power) (?:\w+ ){1,4}off$",
+        r"^(?:apaga|apagar|apague|desactiva|desactivar|desactive)\b",
+    ],
+    "toggle": [
+        r"^toggle\b",
+        r"^(?:alterna|alternar|alterne)\b",
+    ],
+}
+
+# Stripped before matching; "please" may also close the sentence
+POLITE_PREFIX = re.compile(r"^(?:please|pls|por favor)\s+")
+POLITE_SUFFIX = re.compile(r"\s+(?:please|pls|por favor)$")
+
+# Anything that schedules, conditions, negates, combines or hedges the action
+# goes to Gemini: a false positive here switches a real device
+FALLBACK_RULES = [
+    # Negation and compound requests
+    r"\b(?:don t|do not|dont|never|no|not|nunca|tampoco)\b",
+    r"\b(?:and|then|also|y|e|luego|despues|tambien)\b",
+    # Conditions
+    r"\b(?:if|unless|when|whenever|once|while|until|till|before|after|as soon as)\b",
+    r"\b(?:si|cuando|mientras|hasta|antes|apenas|en cuanto)\b",
+    # Times and durations; "in the kitchen" / "en la cocina" are places, and
+    # time words after an article are caught by the word lists below
+    r"\b(?:at|in)\b(?! (?:the|my|our|this|that)\b)",
+    r"\b(?:for|every|each|during|within)\b(?! me\b)",
+    r"\b(?:today|tonight|tomorrow|later|soon|morning|afternoon|evening|night|noon|midnight)\b",
+    r"\b(?:am|pm|o clock|second|seconds|minute|minutes|min|mins|hour|hours|day|days|week|weekend|time|moment)\b",
+    r"\ben\b(?! (?:el|la|los|las|mi|mis|este|esta)\b)",
+    r"\b(?:a las|a la|por|durante|cada|dentro de)\b",
+    r"\b(?:hoy|manana|pasado|luego|mas tarde|tarde|noche|mediodia|medianoche)\b",
+    r"\b(?:segundo|segundos|minuto|minutos|hora|horas|dia|dias|semana|rato|momento)\b",
+    # Modals, reminders and reports
+    r"\b(?:should|could|would|can|may|might|must|will|shall)\b",
+    r"\b(?:remind|reminder|remember|forgot|forget|schedule|timer)\b",
+    r"\b(?:deberia|deberias|debo|puedes|podrias|puede|quieres|recuerda|recuerdame|olvide|olvido|programa|temporizador)\b",
+]
+
+# Generic device words; naming another kind of device than the current object
+# without a known alias is left to Gemini rather than guessed
+DEVICE_WORDS = {
+    "light": {"light", "lights", "lamp", "luz", "luces", "lampara", "foco"},
+    "fan": {"fan", "ventilador"},
+    "switch": {"plug", "outlet", "enchufe", "interruptor"},
+    "media_player": {"tv", "television", "tele", "speaker", "music", "musica", "altavoz"},
+    "climate": {"ac", "heater", "heating", "thermostat", "aire", "calefaccion", "termostato"},
+    "humidifier": {"humidifier", "humidificador"},
+}
+
+_compiled_actions = {
+    action: [re.compile(rule) for rule in rules] for action, rules in ACTION_RULES.items()
+}
+_compiled_fallback = [re.compile(rule) for rule in FALLBACK_RULES]
+
+
+def normalize(text: str) -> str:
+    """Lower-case, strip accents and punctuation, collapse whitespace"""
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+class AliasIndex:
+    """Friendly name / alias -> entity_id, built from the entities table.
+
+    Aliases come from `attributes.friendly_name`, an optional
+    `attributes.aliases` list and the entity's object id with underscores
+    as spaces. The index is rebuilt at most every `ttl` seconds.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.aliases: Dict[str, str] = {}
+        self.names: Dict[str, str] = {}
+        self.loaded_at: Optional[float] = None
+
+    async def refresh(self, force: bool = False):
+        if not force and self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+            return
+        aliases: Dict[str, str] = {}
+        names: Dict[str, str] = {}
+        async for entity in db_service.stream_entities():
+            attributes = entity.attributes or {}
+            friendly_name = attributes.get("friendly_name")
+            names[entity.entity_id] = friendly_name or entity.entity_id
+            candidates = [entity.entity_id.split(".", 1)[-1].replace("_", " ")]
+            if friendly_name:
+                candidates.append(friendly_name)
+            extra = attributes.get("aliases") or []
+            if isinstance(extra, list):
+                candidates.extend(alias for alias in extra if isinstance(alias, str))
+            for candidate in candidates:
+                alias = normalize(candidate)
+                if alias:
+                    aliases.setdefault(alias, entity.entity_id)
+
+        self.aliases = aliases
+        self.names = names
+        self.loaded_at = time.monotonic()
+
+    def find(self, text: str) -> Optional[str]:
+        """Entity whose longest alias appears in the text as whole words"""
+        padded = f" {text} "
+        best = None
+        for alias, entity_id in self.aliases.items():
+            if f" {alias} " in padded and (best is None or len(alias) > len(best[0])):
+                best = (alias, entity_id)
+        return best[1] if best else None
+
+
+alias_index = AliasIndex(ttl=settings.intent_alias_ttl)
+
+
+def match_action(text: str) -> Optional[str]:
+    """The single on/off/toggle action of an imperative command, or None.
+
+    `text` is normalized. None means the request is not a plain immediate
+    command (a question, a condition, a time or duration, a modal, ...) and
+    must be left to Gemini.
+    """
+    text = POLITE_SUFFIX.sub("", POLITE_PREFIX.sub("", text))
+    if any(rule.search(text) for rule in _compiled_fallback):
+        return None
+    matched = [
+        action for action, rules in _compiled_actions.items()
+        if any(rule.search(text) for rule in rules)
+    ]
+    return matched[0] if len(matched) == 1 else None
+
+
+async def match(dialogue: str, entity_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Match an obvious device command without calling Gemini.
+
+    The target is the entity named in the dialogue (by alias) or, when the
+    dialogue names none, the object the user is interacting with.
+
+    Returns:
+        Dict with action and entity_id, or None to fall back to Gemini.
+    """
+    if not settings.intent_fast_path:
+        return None
+
+    text = normalize(dialogue)
+    action = match_action(text)
+    if action is None:
+        return None
+
+    try:
+        await alias_index.refresh()
+    except Exception as e:
+        print(f"{color_style.WARNING} Could not load entity aliases: {e}")
+
+    target = alias_index.find(text)
+    if target is None:
+        target = entity_id
+        domain = (entity_id or "").split(".")[0]
+        words = set(text.split())
+        if any(words & nouns for kind, nouns in DEVICE_WORDS.items() if kind != domain):
+            return None
+    if not target or target.split(".")[0] not in CONTROLLABLE_DOMAINS:
+        return None
+    return {"action": action, "entity_id": target}
+
+
+def friendly_name(entity_id: str, state: Optional[Dict[str, Any]] = None) -> str:
+    if state and state.get("attributes", {}).get("friendly_name"):
+        return state["attributes"]["friendly_name"]
+    return alias_index.names.get(entity_id) or entity_id.split(".", 1)[-1].replace("_", " ")
+
+
+def build_reply(entity_id: str, new_state: str, state: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """A reply with the same shape as Gemini's (see rob_context)"""
+    name = friendly_name(entity_id, state)
+    return {
+        "comment": f"Done! The {name} is now {new_state}.",
+        "instruction": f"turn_{new_state}",
+        "state": new_state,
+        "suggest": None,
+        "status": "success",
+        "context": {
+            "domain": entity_id.split(".")[0],
+            "friendly_name": name,
+            "attributes_used": ["friendly_name"],
+        },
+        "source": "local",
+    }
+
+
+def resolve_state(action: str, state: Optional[Dict[str, Any]]) -> str:
+    """on/off to request for an action; toggle flips the current state"""
+    if action == "turn_on":
+        return "on"
+    if action == "turn_off":
+        return "off"
+    current = (state or {}).get("state")
+    return "off" if current == "on" else "on"
@@ -0,0 +1,107 @@
+import json
+import re
+from typing import Any, Dict, Optional
+from app.services.conversation_service import estimate_tokens
+from app.utils import rob_context
+
+
+def compact_instruction(text: str) -> str:
+    """Strip the source indentation and repeated blank lines of a prompt"""
+    text = "\n".join(line.strip() for line in text.strip().splitlines())
+    return re.sub(r"\n{3,}", "\n\n", text)
+
+
+# Built once: the Rob persona/format rules sent as Gemini's system_instruction
+SYSTEM_INSTRUCTION = compact_instruction(rob_context.VIRTUAL_GREETER_CONTEXT)
+
+# Attributes Rob can talk about; everything else (icons, feature bitmasks,
+# effect and mode lists, ...) is dropped from the object before sending it
+COMMON_ATTRIBUTES = ("friendly_name", "device_class", "unit_of_measurement")
+DOMAIN_ATTRIBUTES = {
+    "light": ("brightness", "color_mode", "color_temp_kelvin", "rgb_color"),
+    "switch": (),
+    "fan": ("percentage", "preset_mode", "oscillating"),
+    "climate": ("current_temperature", "temperature", "hvac_action", "current_humidity"),
+    "cover": ("current_position",),
+    "media_player": ("volume_level", "is_volume_muted", "media_title", "media_artist", "source"),
+    "sensor": ("state_class",),
+    "binary_sensor": (),
+    "humidifier": ("humidity", "current_humidity", "mode"),
+    "camera": (),
+}
+
+
+def trim_attributes(domain: str, attributes: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Keep only the attributes the prompt uses for this domain"""
+    if not attributes:
+        return {}
+    keep = COMMON_ATTRIBUTES + DOMAIN_ATTRIBUTES.get(domain, ())
+    return {key: attributes[key] for key in keep if attributes.get(key) is not None}
+
+
+def trim_object(obj: Any) -> Any:
+    """Compact form of a Home Assistant state object for the prompt"""
+    if not isinstance(obj, dict) or "entity_id" not in obj:
+        return obj
+    domain = obj["entity_id"].split(".")[0]
+    return {
+        "entity_id": obj["entity_id"],
+        "state": obj.get("state"),
+        "attributes": trim_attributes(domain, obj.get("attributes")),
+    }
+
+
+def build_prompt(prompt: Dict[str, Any]) -> str:
+    """Per-turn user content: object (trimmed), dialogue and history as compact JSON"""
+    if not isinstance(prompt, dict):
+        return str(prompt)
+    compact = dict(prompt)
+    if "object" in compact:
+        compact["object"] = trim_object(compact["object"])
+    return json.dumps(compact, ensure_ascii=False, separators=(",", ":"))
+
+
+def build_body(prompt: Dict[str, Any], cached_content: Optional[str] = None) -> Dict[str, Any]:
+    """generateContent request body.
+
+    The system instruction is referenced through a cachedContents entry
+    when one is given, otherwise sent as system_instruction (which the
+    API can reuse across calls through implicit prefix caching).
+    """
+    body: Dict[str, Any] = {
+        "contents": [{"role": "user", "parts": [{"text": build_prompt(prompt)}]}],
+    }
+    if cached_content:
+        body["cachedContent"] = cached_content
+    else:
+        body["system_instruction"] = {"parts": [{"text": SYSTEM_INSTRUCTION}]}
+    return body
+
+
+class UsageStats:
+    """Token usage reported by Gemini (usageMetadata), summed over requests"""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+
+    def record(self, usage: Dict[str, Any]):
+        self.requests += 1
+        self.prompt_tokens += usage.get("promptTokenCount", 0)
+        self.cached_tokens += usage.get("cachedContentTokenCount", 0)
+        self.output_tokens += usage.get("candidatesTokenCount", 0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.requests, 1) if self.requests else None,
+            "system_instruction_tokens_estimate": estimate_tokens(SYSTEM_INSTRUCTION),
+        }
+
+
+usage_stats = UsageStats()
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set
+from app.core.config import settings
+
+
+class StateCache:
+    """In-memory copy of Home Assistant entity states.
+
+    Keyed by entity_id and indexed by domain. It is seeded once from the
+    REST `/states` dump and kept current by the `state_changed` events that
+    the WebSocket listener receives.
+    """
+
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self.states: Dict[str, Dict[str, Any]] = {}
+        self.by_domain: Dict[str, Set[str]] = defaultdict(set)
+        self.seeded_at: Optional[float] = None
+        self.last_event_at: Optional[float] = None
+        # True while the HA WebSocket listener is subscribed to state_changed
+        self.live = False
+        self.lock = asyncio.Lock()
+        # Reads answered from memory vs. ones that had to go to HA REST
+        self.hits = 0
+        self.misses = 0
+        self.events = 0
+
+    @staticmethod
+    def domain_of(entity_id: str) -> str:
+        return entity_id.split(".")[0]
+
+    def seed(self, entities: List[Dict[str, Any]]):
+        """Replace the whole cache with a fresh `/states` dump"""
+        self.states = {}
+        self.by_domain = defaultdict(set)
+        for entity in entities:
+            self.set(entity)
+        self.seeded_at = time.monotonic()
+
+    def set(self, entity: Dict[str, Any]):
+        """Insert or replace a single state object"""
+        entity_id = entity["entity_id"]
+        self.states[entity_id] = entity
+        self.by_domain[self.domain_of(entity_id)].add(entity_id)
+
+    def remove(self, entity_id: str):
+        self.states.pop(entity_id, None)
+        domain = self.domain_of(entity_id)
+        ids = self.by_domain.get(domain)
+        if ids is not None:
+            ids.discard(entity_id)
+            if not ids:
+                del self.by_domain[domain]
+
+    def apply_event(self, entity_id: str, new_state: Optional[Dict[str, Any]]):
+        """Apply a `state_changed` event (new_state is None when removed)"""
+        if new_state is None:
+            self.remove(entity_id)
+        else:
+            # Events buffered while seeding may be older than the seed itself
+            current = self.states.get(entity_id)
+            if current and current.get("last_updated", "") > new_state.get("last_updated", ""):
+                return
+            self.set(new_state)
+        self.events += 1
+        self.last_event_at = time.monotonic()
+
+    def age(self) -> Optional[float]:
+        """Seconds since the last full seed, or None if never seeded"""
+        if self.seeded_at is None:
+            return None
+        return time.monotonic() - self.seeded_at
+
+    def is_stale(self) -> bool:
+        """A live cache is always fresh; otherwise it expires after max_age"""
+        if self.seeded_at is None:
+            return True
+        if self.live:
+            return False
+        return self.age() > self.max_age
+
+    def record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def get(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        return self.states.get(entity_id)
+
+    def get_domain(self, domain: str) -> List[Dict[str, Any]]:
+        return [self.states[entity_id] for entity_id in self.by_domain.get(domain, ())]
+
+    def all(self) -> List[Dict[str, Any]]:
+        return list(self.states.values())
+
+    def grouped(self) -> List[Dict[str, Any]]:
+        return [
+            {"domain": domain, "entities": [self.states[e] for e in ids]}
+            for domain, ids in self.by_domain.items()
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        reads = self.hits + self.misses
+        return {
+            "entities": len(self.states),
+            "domains": len(self.by_domain),
+            "live": self.live,
+            "age": self.age(),
+            "stale": self.is_stale(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / reads, 3) if reads else None,
+            "events": self.events,
+        }
+
+
+state_cache = StateCache(max_age=settings.ha_state_cache_max_age)
@@ -0,0 +1,158 @@
+import asyncio
+from datetime import datetime
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.repositories.entity_repository import ha_timestamp
+from app.services import db_service, history_service
+from app.utils import color_style
+
+
+class StateWriter:
+    """Write-behind queue for entity state persistence.
+
+    The HA listener enqueues state changes without waiting on the database.
+    Pending updates are coalesced per entity_id (latest wins) and flushed
+    in one transaction when the batch size is reached or the flush interval
+    elapses, and once more on shutdown. Every change is also appended, not
+    coalesced, to the state history written in the same flush.
+    """
+
+    def __init__(self, flush_interval: float, batch_size: int, max_pending: int):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=max_pending)
+        self.flush_requested = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.running = False
+        self.flushed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.history_written = 0
+        self.history_dropped = 0
+
+    def enqueue(self, entity_id: str, state: str, attributes: Dict[str, Any], changed_at: Any = None):
+        """Queue a state change; never blocks
+
+        `changed_at` is the event's HA timestamp (ISO string or datetime).
+        It dates the change, so a backlog or a reconnect burst does not
+        shift history points; the time of enqueue is used when it is
+        missing or invalid.
+        """
+        if entity_id in self.pending:
+            # Re-insert so the dict stays ordered oldest -> newest
+            del self.pending[entity_id]
+            self.coalesced += 1
+        elif len(self.pending) >= self.max_pending:
+            oldest = next(iter(self.pending))
+            del self.pending[oldest]
+            self.dropped += 1
+            print(f"{color_style.WARNING} Write-behind queue full, dropped pending update for {oldest}")
+
+        now = datetime.now()
+        try:
+            now = ha_timestamp(changed_at, now)
+        except ValueError:
+            pass
+        self.pending[entity_id] = {
+            "state": state,
+            "attributes": attributes,
+            "last_updated": now,
+        }
+        if settings.history_enabled:
+            if len(self.history) == self.max_pending:
+                # The deque discards the oldest row on append
+                self.history_dropped += 1
+            self.history.append(history_service.history_row(entity_id, state, now))
+        if len(self.pending) >= self.batch_size or len(self.history) >= self.batch_size:
+            self.flush_requested.set()
+
+    async def flush(self) -> int:
+        """Write all pending updates and history rows"""
+        count = await self.flush_entities()
+        await self.flush_history()
+        return count
+
+    async def flush_history(self) -> int:
+        if not self.history:
+            return 0
+
+        rows = list(self.history)
+        self.history.clear()
+        try:
+            async with AsyncSessionLocal() as db:
+                count = await db_service.append_history(rows, db)
+        except Exception as e:
+            print(f"{color_style.ERROR} State history flush failed: {e}")
+            # Requeue ahead of newer rows; the newest max_pending are kept
+            self.history_dropped += max(0, len(rows) + len(self.history) - self.max_pending)
+            self.history = deque([*rows, *self.history], maxlen=self.max_pending)
+            return 0
+
+        self.history_written += count
+        return count
+
+    async def flush_entities(self) -> int:
+        """Write all pending entity updates in one transaction"""
+        if not self.pending:
+            return 0
+
+        batch, self.pending = self.pending, {}
+        try:
+            async with AsyncSessionLocal() as db:
+                count = await db_service.update_entities(batch, db)
+        except Exception as e:
+            print(f"{color_style.ERROR} Write-behind flush failed: {e}")
+            # Put the batch back without overwriting anything newer
+            for entity_id, values in batch.items():
+                if entity_id not in self.pending and len(self.pending) < self.max_pending:
+                    self.pending[entity_id] = values
+            return 0
+
+        self.flushed += count
+        print(f"{color_style.LOGGER} Flushed {count} entity updates to database")
+        return count
+
+    async def run(self):
+        while self.running:
+            try:
+                await asyncio.wait_for(self.flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_requested.clear()
+            await self.flush()
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.running = True
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the flush loop and write whatever is still pending"""
+        self.running = False
+        if self.task is not None:
+            self.flush_requested.set()
+            await self.task
+            self.task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self.pending),
+            "flushed": self.flushed,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "history_pending": len(self.history),
+            "history_written": self.history_written,
+            "history_dropped": self.history_dropped,
+        }
+
+
+state_writer = StateWriter(
+    flush_interval=settings.state_flush_interval,
+    batch_size=settings.state_flush_batch_size,
+    max_pending=settings.state_max_pending,
+)
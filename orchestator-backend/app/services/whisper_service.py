@@ -1,75 +1,354 @@
 import asyncio
-import tempfile
-import os
-import wave
 import logging
-from pathlib import Path
-from typing import Optional
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.services import whisper_worker
 from app.utils import color_style
-from faster_whisper import WhisperModel
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize model once (GPU if available)
-model = WhisperModel("small", device="cpu")
 
 
-async def transcribe_audio(audio_bytes: bytes, audio_format: str = "wav") -> str:
+class WhisperBusyError(Exception):
+    """Raised when the transcription queue is saturated"""
+
+
+class NoSpeechError(Exception):
+    """Raised when an utterance has no speech left after silence trimming"""
+
+
+# Latency/accuracy trade-offs selectable per audio_command. All profiles share
+# the whisper_compute_type model and differ only in decoding options; the
+# compute_type below is used only with whisper_profile_compute_types (opt-in,
+# one more model per distinct type in every worker).
+PROFILES: Dict[str, Dict[str, Any]] = {
+    # Interactive greeter: greedy decoding, pinned language (if set), no fallback
+    "fast": {
+        "compute_type": "int8",
+        "pin_language": True,
+        "transcribe": {
+            "beam_size": 1,
+            "best_of": 1,
+            "temperature": 0.0,
+            "condition_on_previous_text": False,
+        },
+    },
+    "balanced": {
+        "compute_type": None,  # whisper_compute_type
+        "pin_language": True,
+        "transcribe": {
+            "beam_size": 3,
+            "best_of": 3,
+            "temperature": (0.0, 0.4, 0.8),
+        },
+    },
+    # Offline review: full beam search, language detection, full fallback
+    "accurate": {
+        "compute_type": "float32",
+        "pin_language": False,
+        "transcribe": {
+            "beam_size": 5,
+            "best_of": 5,
+            "temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+        },
+    },
+}
+
+
+def profile_options(name: Optional[str] = None) -> Dict[str, Any]:
+    """Worker options for a named profile (server default when name is None)"""
+    name = name or settings.whisper_profile
+    if name not in PROFILES:
+        raise ValueError(f"Unknown transcription profile: {name} (expected one of {', '.join(PROFILES)})")
+
+    profile = PROFILES[name]
+    kwargs = dict(profile["transcribe"])
+    if profile["pin_language"] and settings.whisper_language:
+        kwargs["language"] = settings.whisper_language
+    return {
+        "profile": name,
+        "compute_type": profile["compute_type"] if settings.whisper_profile_compute_types else None,
+        "transcribe": kwargs,
+    }
+
+
+class WorkerPool:
+    """Pool of Whisper worker processes with admission control.
+
+    Each worker process holds its own model, so concurrent utterances no
+    longer contend on one model (and the GIL) inside the API process. At
+    most `workers` jobs run at once; up to `max_queue` more may wait, each
+    for at most `max_wait` seconds, before the caller gets WhisperBusyError.
+    With `workers=0` jobs run in a thread of the API process instead.
+
+    Models are loaded lazily by the workers (or eagerly in the background
+    when warm-up is enabled) and released again after `idle_unload`
+    seconds without requests, so API cold start never waits on the model.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int],
+        max_queue: int,
+        max_wait: float,
+        model_size: str,
+        device: str,
+        compute_type: str,
+        warmup: bool = False,
+        idle_unload: float = 0.0,
+    ):
+        self.in_process = workers == 0
+        self.workers = 1 if self.in_process else (workers or os.cpu_count() or 1)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.slots = asyncio.Semaphore(self.workers)
+        self.model_size = model_size
+        self.device = device
+        self.compute_type = compute_type
+        self.warmup = warmup
+        self.idle_unload = idle_unload
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.background: list = []
+        self.loaded = False
+        self.last_used = time.monotonic()
+        self.waiting = 0
+        self.running = 0
+        if self.in_process:
+            # Only records the model spec; nothing is loaded yet
+            whisper_worker.init_worker(model_size, device, compute_type, 0)
+        self.completed = 0
+        self.rejected = 0
+
+    def start(self):
+        if self.in_process or self.executor is not None:
+            return
+        # Split the cores between workers instead of oversubscribing them
+        cpu_threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=whisper_worker.init_worker,
+            initargs=(self.model_size, self.device, self.compute_type, cpu_threads, self.warmup),
+        )
+        print(f"{color_style.INFO} Whisper pool started with {self.workers} workers ({cpu_threads} threads each)")
+
+    def start_lifecycle(self):
+        """Start background warm-up (if enabled) and the idle unloader"""
+        if self.warmup:
+            self.background.append(asyncio.create_task(self.warm_up()))
+        if self.idle_unload > 0:
+            self.background.append(asyncio.create_task(self._unload_when_idle()))
+
+    async def warm_up(self):
+        """Load the model in every worker without blocking startup"""
+        try:
+            if self.in_process:
+                await asyncio.to_thread(whisper_worker.warm_up)
+            else:
+                self.start()
+                loop = asyncio.get_running_loop()
+                # One job per worker makes the executor spawn all processes
+                await asyncio.gather(*[
+                    loop.run_in_executor(self.executor, whisper_worker.warm_up)
+                    for _ in range(self.workers)
+                ])
+            self.loaded = True
+            self.last_used = time.monotonic()
+            print(f"{color_style.INFO} Whisper model {self.model_size}/{self.compute_type} warmed up")
+        except Exception as e:
+            print(f"{color_style.WARNING} Whisper warm-up failed: {e}")
+
+    def unload(self):
+        """Release the models (and worker processes) until the next request"""
+        if self.in_process:
+            whisper_worker.unload()
+        else:
+            self.shutdown()
+        self.loaded = False
+        print(f"{color_style.INFO} Whisper model unloaded after {self.idle_unload:.0f}s idle")
+
+    async def _unload_when_idle(self):
+        interval = max(1.0, min(self.idle_unload / 2, 30.0))
+        while True:
+            await asyncio.sleep(interval)
+            idle = time.monotonic() - self.last_used
+            if self.loaded and not self.running and not self.waiting and idle >= self.idle_unload:
+                self.unload()
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+            print(f"{color_style.INFO} Whisper pool stopped")
+
+    def stop(self):
+        """Stop background tasks and worker processes (call at shutdown)"""
+        for task in self.background:
+            task.cancel()
+        self.background = []
+        self.shutdown()
+
+    async def _acquire(self):
+        if self.slots.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise WhisperBusyError("Speech recognition is busy, try again in a moment")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise WhisperBusyError("Speech recognition is busy, try again in a moment")
+        finally:
+            self.waiting -= 1
+
+    def _release(self, job: Optional[asyncio.Future] = None):
+        if job is not None and not job.cancelled():
+            # Retrieve the outcome nobody awaits anymore
+            job.exception()
+        self.running -= 1
+        self.last_used = time.monotonic()
+        self.slots.release()
+
+    async def transcribe(self, audio_bytes, audio_format: str, options: Optional[Dict[str, Any]] = None):
+        await self._acquire()
+        self.running += 1
+        job = None
+        release = True
+        try:
+            if self.in_process:
+                job = asyncio.ensure_future(
+                    asyncio.to_thread(whisper_worker.transcribe, audio_bytes, audio_format, options)
+                )
+            else:
+                self.start()
+                loop = asyncio.get_running_loop()
+                # Worker processes need a picklable copy of the audio
+                job = loop.run_in_executor(
+                    self.executor, whisper_worker.transcribe, bytes(audio_bytes), audio_format, options
+                )
+            result = await asyncio.shield(job)
+            self.completed += 1
+            self.loaded = True
+            return result
+        except asyncio.CancelledError:
+            if job is not None and not job.done():
+                # The worker keeps transcribing: hold its slot until it is done
+                release = False
+                job.add_done_callback(self._release)
+            raise
+        except BrokenProcessPool:
+            print(f"{color_style.ERROR} Whisper worker crashed, restarting pool")
+            self.executor = None
+            raise
+        finally:
+            if release:
+                self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "in_process": self.in_process,
+            "model": f"{self.model_size}/{self.compute_type}",
+            "loaded": self.loaded,
+            "running": self.running,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+pool = WorkerPool(
+    workers=settings.whisper_workers,
+    max_queue=settings.whisper_max_queue,
+    max_wait=settings.whisper_max_wait,
+    model_size=settings.whisper_model_size,
+    device=settings.whisper_device,
+    compute_type=settings.whisper_compute_type,
+    warmup=settings.whisper_warmup,
+    idle_unload=settings.whisper_idle_unload,
+)
+
+
+def vad_options() -> Optional[Dict[str, Any]]:
+    """Silence trimming parameters from settings, or None when disabled"""
+    if not settings.whisper_vad:
+        return None
+    return {
+        "threshold_db": settings.vad_threshold_db,
+        "dynamic_range_db": settings.vad_dynamic_range_db,
+        "min_pause": settings.vad_min_pause,
+        "padding": settings.vad_padding,
+        "max_chunk": settings.vad_max_chunk,
+    }
+
+
+async def transcribe_audio(
+    audio_bytes: bytes, audio_format: str = "wav", profile: Optional[str] = None
+) -> Dict[str, Any]:
     """Transcribe raw audio bytes using faster-whisper.
 
-    The library expects a filename or a numpy array. To keep this async-friendly
-    we write bytes to a temporary file and run the (blocking) transcribe call
-    in a thread using asyncio.to_thread.
+    The audio is decoded in memory to a 16 kHz mono float32 array (WAV is
+    parsed directly, compressed formats are piped through the decoder) and
+    the array is passed to the model, so no temporary file is written.
+    Leading/trailing silence and long pauses are trimmed first, and long
+    audio is split at pauses. Decoding and transcription run in a worker
+    of the Whisper pool.
 
     Args:
         audio_bytes: Raw audio file bytes (wav, mp3, etc.).
-        suffix: File suffix to hint the audio format (default: .wav).
+        audio_format: Audio format of the bytes (default: wav).
+        profile: Transcription profile name (default: whisper_profile).
 
     Returns:
-        The concatenated transcription string.
-    """
-
-    def _sync_transcribe(tmp_path: str) -> tuple[str, Optional[str]]:
-        # Blocking call to faster-whisper
-        segments, info = model.transcribe(tmp_path)
-        text = " ".join(segment.text for segment in segments)
-        lang = getattr(info, "language", None)
-        return text, lang
+        Dict with the transcription text, detected language and stats
+        (audio_seconds received vs decoded_seconds sent to the model).
 
-    # Write bytes to a temporary file so ffmpeg / faster-whisper can read it
-    tmp_path = None
+    Raises:
+        ValueError: If the profile is unknown.
+        WhisperBusyError: If the pool is saturated.
+        NoSpeechError: If no speech is left after trimming.
+    """
+    options = profile_options(profile)
+    options["vad"] = vad_options()
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{audio_format}") as tmp:
-            tmp.write(audio_bytes)
-            tmp.flush()
-            tmp_path = tmp.name
-            
-        # Para WAV, validar el formato
-        if audio_format.lower() == "wav":
-            try:
-                with wave.open(tmp_path, 'rb') as wav:
-                    print(f"{color_style.LOGGER} "
-                          f"WAV info: channels={wav.getnchannels()}, "
-                          f"width={wav.getsampwidth()}, "
-                          f"rate={wav.getframerate()}, "
-                          f"frames={wav.getnframes()}"
-                    )
-            except Exception as e:
-                print(f"{color_style.ERROR}Invalid WAV file: {e}")
-                raise ValueError(f"Invalid WAV file: {e}")
-
-        # Run the blocking transcription in a thread to avoid blocking the event loop
-        text, lang = await asyncio.to_thread(_sync_transcribe, tmp_path)
-        if lang:
-            print(f"{color_style.LOGGER} Language detected: {lang}")
-        return text
+        result = await pool.transcribe(audio_bytes, audio_format, options)
+    except WhisperBusyError:
+        print(f"{color_style.WARNING} Whisper pool busy, rejecting utterance")
+        raise
     except Exception as e:
         print(f"{color_style.ERROR} Transcription error: {e}")
         raise
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.remove(tmp_path)
-            except Exception:
-                print(f"{color_style.WARNING} Could not remove temp file {tmp_path}")
+
+    print(
+        f"{color_style.LOGGER} Decoded {result['decoded_seconds']:.2f}s of "
+        f"{result['audio_seconds']:.2f}s {audio_format.upper()} audio in {result['chunks']} chunks"
+    )
+    if result["chunks"] == 0:
+        raise NoSpeechError("No speech detected")
+    result["profile"] = options["profile"]
+    if result["language"]:
+        print(f"{color_style.LOGGER} Language detected: {result['language']}")
+    return result
+
+
+async def transcribe_partial(audio_bytes: bytes, audio_format: str = "wav") -> Dict[str, Any]:
+    """Transcribe the audio received so far of a streaming upload.
+
+    Uses the stt_partial_profile and only the last stt_partial_window
+    seconds, so each rolling decode stays cheap. Errors are left to the
+    caller, which simply skips the partial.
+    """
+    options = profile_options(settings.stt_partial_profile)
+    options["vad"] = vad_options()
+    options["tail_seconds"] = settings.stt_partial_window
+    result = await pool.transcribe(audio_bytes, audio_format, options)
+    if result["chunks"] == 0:
+        raise NoSpeechError("No speech detected")
+    return result
@@ -0,0 +1,106 @@
+"""Whisper inference worker process.
+
+Runs inside the processes of the whisper_service pool (or in a thread of
+the API process when the pool is disabled). Models live in a per-process
+registry keyed by (size, compute_type) and are loaded on first use, so
+nothing is loaded at import time. This module must stay light: it is
+imported by every spawned worker, so it only depends on app.utils.audio
+(numpy), and app/__init__.py has no imports.
+"""
+import threading
+from typing import Any, Dict, Optional, Tuple
+from app.utils import audio
+
+# Default model spec and thread count for this process, set by init_worker
+config = {
+    "model_size": "small",
+    "device": "cpu",
+    "compute_type": "default",
+    "cpu_threads": 0,
+}
+models: Dict[Tuple[str, str], object] = {}
+# Guards loading when warm-up and a request race in the same process
+models_lock = threading.Lock()
+
+
+def init_worker(model_size: str, device: str, compute_type: str, cpu_threads: int, preload: bool = False):
+    """Pool initializer: remember the default model, optionally load it now"""
+    config.update(
+        model_size=model_size, device=device, compute_type=compute_type, cpu_threads=cpu_threads
+    )
+    if preload:
+        get_model()
+
+
+def get_model(model_size: Optional[str] = None, compute_type: Optional[str] = None):
+    """Return a loaded model, loading it on first use"""
+    key = (model_size or config["model_size"], compute_type or config["compute_type"])
+    model = models.get(key)
+    if model is None:
+        with models_lock:
+            model = models.get(key)
+            if model is None:
+                from faster_whisper import WhisperModel
+
+                model = WhisperModel(
+                    key[0], device=config["device"], compute_type=key[1], cpu_threads=config["cpu_threads"]
+                )
+                models[key] = model
+    return model
+
+
+def loaded_models():
+    return [f"{size}/{compute_type}" for size, compute_type in models]
+
+
+def warm_up() -> list:
+    """Load the default model; used to warm workers in the background"""
+    get_model()
+    return loaded_models()
+
+
+def unload():
+    """Drop every loaded model so its memory can be reclaimed"""
+    with models_lock:
+        models.clear()
+
+
+def transcribe(audio_bytes: bytes, audio_format: str, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Decode, trim and transcribe one utterance.
+
+    With `options["vad"]` set, leading/trailing silence and long pauses are
+    removed and long audio is cut at pauses before decoding. The model is
+    not invoked at all when no speech is left. `options["model_size"]`,
+    `options["compute_type"]` and `options["transcribe"]` (keyword
+    arguments for model.transcribe) come from the transcription profile.
+    `options["tail_seconds"]` keeps only the most recent audio (rolling
+    window for partial transcripts).
+
+    Returns:
+        Dict with text, language, audio_seconds (received), decoded_seconds
+        (sent to the model) and chunks.
+    """
+    options = options or {}
+    samples = audio.decode_audio(audio_bytes, audio_format)
+    tail = options.get("tail_seconds")
+    if tail:
+        samples = samples[-int(tail * audio.SAMPLE_RATE):]
+    vad = options.get("vad")
+    chunks = audio.split_speech(samples, **vad) if vad else [samples]
+
+    texts = []
+    language = None
+    if chunks:
+        model = get_model(options.get("model_size"), options.get("compute_type"))
+        for chunk in chunks:
+            segments, info = model.transcribe(chunk, **options.get("transcribe", {}))
+            texts.extend(segment.text for segment in segments)
+            language = language or getattr(info, "language", None)
+
+    return {
+        "text": " ".join(texts),
+        "language": language,
+        "audio_seconds": round(audio.duration(samples), 3),
+        "decoded_seconds": round(sum(audio.duration(chunk) for chunk in chunks), 3),
+        "chunks": len(chunks),
+    }
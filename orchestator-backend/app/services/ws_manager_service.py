@@ -1,16 +1,289 @@
+import asyncio
 import base64
+import fnmatch
+import functools
 import json
+import re
+import time
+from collections import defaultdict, deque
+from app.core.config import settings
 from app.utils import color_style
-from typing import Dict, Any
+from typing import Awaitable, Deque, Dict, Any, List, Optional, Set, Tuple, Union
 from datetime import datetime
-from app.services import ha_service, whisper_service, ai_service
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from app.services import (
+    ha_service, whisper_service, ai_service, intent_service, conversation_service, prompt_service, gemini_client
+)
+from app.services.state_cache_service import state_cache
+from app.services.state_writer_service import state_writer
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+# Maximum size of a single utterance, base64 (audio_command) or raw (binary upload)
+MAX_AUDIO_BYTES = 5242880
+SUPPORTED_AUDIO_FORMATS = ["wav", "mp3"]
+
+# A message already encoded to a WebSocket text frame
+Frame = str
+
+
+def encode_message(message: Union[Dict[str, Any], Frame]) -> Frame:
+    """Encode a message once into a text frame (same format as send_json)"""
+    if isinstance(message, str):
+        return message
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def coalesce_key(message: Dict[str, Any]) -> Optional[Tuple[Any, str]]:
+    """(type, entity_id) of an entity update, used by the coalesce policy"""
+    data = message.get("data")
+    if isinstance(data, dict) and data.get("entity_id"):
+        return message.get("type"), data["entity_id"]
+    return None
+
+
+async def timed(timings: Dict[str, float], stage: str, work: Awaitable):
+    """Await work and record how long it took, in ms, as timings[stage]"""
+    start = time.perf_counter()
+    try:
+        return await work
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 2)
+
+
+class AudioUpload:
+    """Raw audio received as binary WebSocket frames between audio_start and audio_end.
+
+    Chunks are copied into one preallocated buffer (sized from the client's
+    size hint) instead of being base64 encoded inside JSON. Streaming
+    uploads also get rolling partial transcripts while audio arrives.
+    """
+
+    def __init__(
+        self,
+        audio_format: str,
+        size_hint: int,
+        max_size: int,
+        profile: Optional[str] = None,
+        streaming: bool = False,
+        request_id: Any = None,
+    ):
+        self.audio_format = audio_format
+        self.profile = profile
+        self.streaming = streaming
+        self.request_id = request_id
+        self.partial_at = time.monotonic()
+        self.partial_task: Optional[asyncio.Task] = None
+        self.max_size = max_size
+        self.buffer = bytearray(min(max(size_hint, 0), max_size))
+        self.length = 0
+        self.chunks = 0
+
+    def append(self, chunk: bytes):
+        end = self.length + len(chunk)
+        if end > self.max_size:
+            raise ValueError(f"Audio too large (max {self.max_size // 1048576}MB)")
+        if end > len(self.buffer):
+            # Grow geometrically when the size hint was missing or too small
+            grow_to = min(max(end, 2 * len(self.buffer)), self.max_size)
+            self.buffer.extend(bytes(grow_to - len(self.buffer)))
+        self.buffer[self.length:end] = chunk
+        self.length = end
+        self.chunks += 1
+
+    def view(self) -> memoryview:
+        return memoryview(self.buffer)[:self.length]
+
+
+class ClientConnection:
+    """A connected client with its own bounded outbound queue and writer task.
+
+    Messages are written by a dedicated task so that a slow or stalled
+    client never delays the sender. When the queue is full the slow-consumer
+    policy decides what happens to broadcast messages:
+
+    - drop_oldest: discard the oldest queued broadcast
+    - coalesce: replace a queued broadcast for the same entity, else drop oldest
+    - disconnect: close the connection
+
+    Direct replies are never evicted; if only direct replies are queued,
+    the incoming broadcast is dropped instead.
+    """
+
+    def __init__(
+        self, websocket: WebSocket, client_id: str, max_queue: int, policy: str, max_inflight: int
+    ):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.max_queue = max_queue
+        self.policy = policy
+        # Each item is (coalesce key, encoded frame, droppable)
+        self.queue: Deque[Tuple[Optional[Tuple[Any, str]], Frame, bool]] = deque()
+        self.ready = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+        self.closing = False
+        self.sent = 0
+        self.dropped = 0
+        # Requests being handled concurrently for this client
+        self.slots = asyncio.Semaphore(max_inflight)
+        self.inflight: Set[asyncio.Task] = set()
+        # Binary audio upload in progress, if any
+        self.upload: Optional[AudioUpload] = None
+
+    def enqueue(self, frame: Frame, key=None, droppable: bool = True):
+        """Queue an encoded frame without waiting on the socket"""
+        if self.closing:
+            return
+
+        if droppable and len(self.queue) >= self.max_queue:
+            if self.policy == "disconnect":
+                print(f"{color_style.WARNING} Client {self.client_id} too slow, disconnecting")
+                self.closing = True
+                self.ready.set()
+                return
+
+            self.dropped += 1
+            if self.policy == "coalesce" and key is not None:
+                for index, (queued_key, _, queued_droppable) in enumerate(self.queue):
+                    if queued_droppable and queued_key == key:
+                        self.queue[index] = (key, frame, True)
+                        return
+            for index, (_, _, queued_droppable) in enumerate(self.queue):
+                if queued_droppable:
+                    del self.queue[index]
+                    break
+            else:
+                # Only direct replies are queued: drop the incoming broadcast
+                return
+
+        self.queue.append((key, frame, droppable))
+        self.ready.set()
+
+    async def run_writer(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                if self.closing:
+                    await self.websocket.close(code=1008)
+                    return
+                while self.queue:
+                    _, frame, _ = self.queue.popleft()
+                    await self.websocket.send_text(frame)
+                    self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"{color_style.ERROR} Error sending to {self.client_id}: {str(e)}")
+            self.closing = True
+
+    def start(self):
+        self.writer = asyncio.create_task(self.run_writer())
+
+    def stop(self):
+        self.closing = True
+        if self.writer is not None and not self.writer.done():
+            self.writer.cancel()
+        for task in list(self.inflight):
+            task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": len(self.queue),
+            "inflight": len(self.inflight),
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
+
+
+class SubscriptionIndex:
+    """Index from entity_id / domain / glob pattern to subscribed clients.
+
+    Exact entity_ids and domains are looked up in dicts, so matching an
+    entity costs O(subscribers) plus one regex test per distinct pattern.
+    """
+
+    TOPICS = ("entity_ids", "domains", "patterns")
+
+    def __init__(self):
+        self.by_entity: Dict[str, Set[str]] = defaultdict(set)
+        self.by_domain: Dict[str, Set[str]] = defaultdict(set)
+        self.by_pattern: Dict[str, Set[str]] = defaultdict(set)
+        self.compiled: Dict[str, re.Pattern] = {}
+        self.client_topics: Dict[str, Dict[str, Set[str]]] = {}
+
+    def _indexes(self):
+        return {
+            "entity_ids": self.by_entity,
+            "domains": self.by_domain,
+            "patterns": self.by_pattern,
+        }
+
+    def subscribe(self, client_id: str, topics: Dict[str, List[str]]):
+        own = self.client_topics.setdefault(client_id, {topic: set() for topic in self.TOPICS})
+        for topic, index in self._indexes().items():
+            for value in topics.get(topic, []):
+                index[value].add(client_id)
+                own[topic].add(value)
+                if topic == "patterns" and value not in self.compiled:
+                    self.compiled[value] = re.compile(fnmatch.translate(value))
+
+    def unsubscribe(self, client_id: str, topics: Dict[str, List[str]]):
+        own = self.client_topics.get(client_id)
+        if own is None:
+            return
+        for topic, index in self._indexes().items():
+            for value in topics.get(topic, []):
+                self._discard(index, value, client_id)
+                own[topic].discard(value)
+
+    def remove_client(self, client_id: str):
+        own = self.client_topics.pop(client_id, None)
+        if own is None:
+            return
+        for topic, index in self._indexes().items():
+            for value in own[topic]:
+                self._discard(index, value, client_id)
+
+    def _discard(self, index: Dict[str, Set[str]], value: str, client_id: str):
+        subscribers = index.get(value)
+        if subscribers is None:
+            return
+        subscribers.discard(client_id)
+        if not subscribers:
+            del index[value]
+            if index is self.by_pattern:
+                self.compiled.pop(value, None)
+
+    def topics_of(self, client_id: str) -> Dict[str, List[str]]:
+        own = self.client_topics.get(client_id, {})
+        return {topic: sorted(values) for topic, values in own.items()}
+
+    def match(self, entity_id: str) -> Set[str]:
+        """Clients subscribed to this entity by id, domain or pattern"""
+        matched = set(self.by_entity.get(entity_id, ()))
+        matched |= self.by_domain.get(entity_id.split(".")[0], set())
+        for pattern, subscribers in self.by_pattern.items():
+            if self.compiled[pattern].match(entity_id):
+                matched |= subscribers
+        return matched
+
 
 class ConnectionManager:
     """Manages WebSocket connections and routes messages to appropriate handlers"""
 
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
+        self.clients: Dict[str, ClientConnection] = {}
+        self.subscriptions = SubscriptionIndex()
+        # Clients that never subscribed receive every broadcast
+        self.unfiltered: Set[str] = set()
+        self.queue_size = settings.ws_client_queue_size
+        self.slow_consumer_policy = settings.ws_slow_consumer_policy
+        self.max_inflight = settings.ws_max_inflight
+        if self.slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            print(f"{color_style.WARNING} Unknown slow consumer policy '{self.slow_consumer_policy}', using drop_oldest")
+            self.slow_consumer_policy = "drop_oldest"
         self.message_handlers = {
             "iot_control": self.handle_iot_control,
             "text_command": self.handle_text_command,
@@ -18,34 +291,185 @@ class ConnectionManager:
             "status_request": self.handle_status_request,
             "ping": self.handle_ping,
             "get_device_state": self.handle_get_device_state,
+            "subscribe": self.handle_subscribe,
+            "unsubscribe": self.handle_unsubscribe,
+            "reset_conversation": self.handle_reset_conversation,
+        }
+        # Handlers that send partial messages before their response and
+        # need the request_id to tag them
+        self.streaming_handlers = {"text_command"}
+        # Handlers that must run in frame order before the next frame is read.
+        # They are plain functions that return either a response or a callable
+        # whose coroutine runs concurrently like any other handler.
+        self.inline_handlers = {
+            "audio_start": self.handle_audio_start,
+            "audio_end": self.handle_audio_end,
         }
 
     async def connect(self, websocket: WebSocket, client_id: str):
         """Register new WebSocket client connection"""
         await websocket.accept()
         self.active_connections[client_id] = websocket
+        client = ClientConnection(
+            websocket, client_id, self.queue_size, self.slow_consumer_policy, self.max_inflight
+        )
+        client.start()
+        self.clients[client_id] = client
+        self.unfiltered.add(client_id)
         print(f"{color_style.CONNECTION} Client {client_id} connected")
 
     def disconnect(self, client_id: str):
         """Remove client from active connections"""
+        client = self.clients.pop(client_id, None)
+        if client is not None:
+            client.stop()
+        self.subscriptions.remove_client(client_id)
+        self.unfiltered.discard(client_id)
+        # Connection-scoped conversation; explicit session_ids outlive the socket
+        conversation_service.memory.clear(client_id)
         if client_id in self.active_connections:
             del self.active_connections[client_id]
             print(f"{color_style.DISCONNECTION} Client {client_id} disconnected")
 
-    async def send_message(self, client_id: str, message: Dict[str, Any]):
-        """Send JSON message to specific client"""
-        if client_id in self.active_connections:
-            websocket = self.active_connections[client_id]
-            await websocket.send_json(message)
+    async def send_message(self, client_id: str, message: Union[Dict[str, Any], Frame]):
+        """Queue JSON message (or pre-encoded frame) for a specific client.
+
+        Direct messages are never dropped by the slow-consumer policy.
+        """
+        client = self.clients.get(client_id)
+        if client is not None:
+            client.enqueue(encode_message(message), droppable=False)
 
     async def broadcast(self, message: Dict[str, Any], exclude_client: str = None):
-        """Broadcast message to all connected clients"""
-        for client_id, websocket in self.active_connections.items():
-            if client_id != exclude_client:
-                try:
-                    await websocket.send_json(message)
-                except Exception as e:
-                    print(f"{color_style.ERROR} Error broadcasting to {client_id}: {str(e)}")
+        """Broadcast message to interested clients without waiting on any socket.
+
+        Entity messages go to clients subscribed to that entity plus clients
+        that never subscribed (which receive everything). Other messages go
+        to all clients. The message is encoded once and the same frame is
+        shared by every queue.
+        """
+        frame = encode_message(message)
+        key = coalesce_key(message)
+        if key is None:
+            targets = list(self.clients)
+        else:
+            targets = self.subscriptions.match(key[1]) | self.unfiltered
+        for client_id in targets:
+            client = self.clients.get(client_id)
+            if client is not None and client_id != exclude_client:
+                client.enqueue(frame, key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-client outbound queue depth and counters"""
+        return {
+            "policy": self.slow_consumer_policy,
+            "queue_size": self.queue_size,
+            "clients": {client_id: client.stats() for client_id, client in self.clients.items()},
+        }
+
+    async def dispatch(self, message: Dict[str, Any], client_id: str):
+        """Handle a message in its own task so slow handlers don't block the connection.
+
+        Waits for a free slot when the client already has max_inflight
+        requests running; the handler coroutine is only created once the
+        slot is held. The response is queued to the client with the
+        request's request_id so out-of-order replies can be matched.
+        """
+        client = self.clients.get(client_id)
+        if client is None:
+            return
+
+        inline = self.inline_handlers.get(message.get("type"))
+        if inline is not None:
+            result = inline(message.get("data", {}), client_id, message.get("request_id"))
+            if isinstance(result, dict):
+                await self._reply(message, client_id, result)
+                return
+            make_work = result
+        else:
+            make_work = functools.partial(self.route_message, message, client_id)
+
+        await client.slots.acquire()
+        task = asyncio.create_task(self._handle_and_reply(make_work, message, client_id))
+        client.inflight.add(task)
+
+        def _done(finished: asyncio.Task):
+            client.inflight.discard(finished)
+            client.slots.release()
+
+        task.add_done_callback(_done)
+
+    async def _handle_and_reply(self, make_work, message: Dict[str, Any], client_id: str):
+        try:
+            response = await make_work()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"{color_style.ERROR} Client {client_id}: {str(e)}")
+            response = {"status": "error", "message": f"Internal error: {str(e)}"}
+        await self._reply(message, client_id, response)
+
+    async def _reply(self, message: Dict[str, Any], client_id: str, response: Dict[str, Any]):
+        request_id = message.get("request_id")
+        if request_id is not None:
+            response = {**response, "request_id": request_id}
+        await self.send_message(client_id, response)
+
+    async def receive_binary(self, chunk: bytes, client_id: str):
+        """Append a binary frame to the client's audio upload"""
+        client = self.clients.get(client_id)
+        if client is None:
+            return
+        if client.upload is None:
+            await self.send_message(client_id, {"status": "error", "message": "Binary frame without audio_start"})
+            return
+        try:
+            client.upload.append(chunk)
+        except ValueError as e:
+            client.upload = None
+            await self.send_message(client_id, {"status": "error", "message": str(e)})
+            return
+        self._maybe_send_partial(client)
+
+    def _maybe_send_partial(self, client: ClientConnection):
+        """Start a rolling decode of a streaming upload, at most one at a time"""
+        upload = client.upload
+        if not upload.streaming or upload.partial_task is not None:
+            return
+        now = time.monotonic()
+        if now - upload.partial_at < settings.stt_partial_interval:
+            return
+        upload.partial_at = now
+
+        # Copy: the buffer keeps growing while the partial is decoded
+        snapshot = bytes(upload.view())
+        task = asyncio.create_task(self._send_partial(upload, snapshot, client.client_id))
+        upload.partial_task = task
+        client.inflight.add(task)
+        task.add_done_callback(client.inflight.discard)
+
+    async def _send_partial(self, upload: AudioUpload, snapshot: bytes, client_id: str):
+        try:
+            result = await whisper_service.transcribe_partial(snapshot, upload.audio_format)
+        except (whisper_service.WhisperBusyError, whisper_service.NoSpeechError):
+            return
+        except Exception as e:
+            # Usually a header-only WAV prefix; the final result will report real errors
+            print(f"{color_style.WARNING} Partial transcription skipped for {client_id}: {e}")
+            return
+        finally:
+            upload.partial_task = None
+
+        await self.send_message(client_id, {
+            "status": "success",
+            "type": "transcription_partial",
+            "request_id": upload.request_id,
+            "data": {
+                "transcription": result["text"],
+                "audio_seconds": result["audio_seconds"],
+                "timestamp": datetime.now().isoformat(),
+            },
+        })
 
     async def route_message(
         self, message: Dict[str, Any], client_id: str
@@ -60,6 +484,8 @@ class ConnectionManager:
             }
 
         handler = self.message_handlers[message_type]
+        if message_type in self.streaming_handlers:
+            return await handler(message.get("data", {}), client_id, message.get("request_id"))
         return await handler(message.get("data", {}), client_id)
 
     """
@@ -68,7 +494,8 @@ class ConnectionManager:
         Pipeline: Audio (base64) -> STT -> NLP -> TTS -> Response Audio
 
         Args:
-            data: Message data containing base64 encoded audio
+            data: Message data containing base64 encoded audio, format and
+                optional transcription profile (fast, balanced, accurate)
             client_id: Client identifier
 
         Returns:
@@ -85,20 +512,108 @@ class ConnectionManager:
 
         try:
             # Validate audio size (max 5MB)
-            if len(audio_base64) > 5242880:
+            if len(audio_base64) > MAX_AUDIO_BYTES:
                 return {"status": "error", "message": "Audio too large (max 5MB)"}
             # Decode audio from base64
             audio_bytes = base64.b64decode(audio_base64)
             print(f"{color_style.LOGGER} Received {len(audio_bytes)} bytes from {client_id}")
+        except Exception as e:
+            print(f"{color_style.ERROR} Audio processing error: {str(e)}")
+            return {"status": "error", "message": f"Audio processing failed: {str(e)}"}
+
+        # Get audio format from data or default to wav
+        audio_format = data.get("format", "wav").lower()
+        return await self.process_audio(audio_bytes, audio_format, client_id, data.get("profile"))
+
+    def handle_audio_start(self, data: Dict[str, Any], client_id: str, request_id: Any = None):
+        """
+        Begin a binary audio upload
+
+        After audio_start the client sends the raw audio as binary frames
+        and finishes with audio_end. No base64 and no JSON wrapping.
+        With stream=true (WAV only) the client may send frames while the
+        user is still talking; transcription_partial messages tagged with
+        this request_id are pushed as the audio arrives, and audio_end
+        returns the final result.
+
+        Args:
+            data: Message data with format, optional size (bytes) hint,
+                optional transcription profile (fast, balanced, accurate)
+                and optional stream flag
+            client_id: Client identifier
+            request_id: Correlation id of the audio_start message
+
+        Returns:
+            Dict acknowledging the upload
+        """
+        audio_format = str(data.get("format", "wav")).lower()
+        if audio_format not in SUPPORTED_AUDIO_FORMATS:
+            return {"status": "error", "message": f"Unsupported audio format: {audio_format}"}
 
-            # Get audio format from data or default to wav
-            audio_format = data.get("format", "wav").lower()
-            if audio_format not in ["wav", "mp3"]:
+        try:
+            size_hint = int(data.get("size", 0))
+        except (TypeError, ValueError):
+            size_hint = 0
+        if size_hint > MAX_AUDIO_BYTES:
+            return {"status": "error", "message": "Audio too large (max 5MB)"}
+
+        profile = data.get("profile")
+        if profile is not None and profile not in whisper_service.PROFILES:
+            return {"status": "error", "message": f"Unknown transcription profile: {profile}"}
+
+        streaming = bool(data.get("stream", False))
+        if streaming and audio_format != "wav":
+            return {"status": "error", "message": "Streaming transcription requires wav audio"}
+
+        self.clients[client_id].upload = AudioUpload(
+            audio_format, size_hint, MAX_AUDIO_BYTES, profile, streaming, request_id
+        )
+        return {"status": "success", "type": "audio_ready"}
+
+    def handle_audio_end(self, data: Dict[str, Any], client_id: str, request_id: Any = None):
+        """
+        Finish a binary audio upload and transcribe it
+
+        The upload is detached right away so a following audio_start
+        cannot mix with it; transcription then runs like any other request.
+
+        Args:
+            data: Message data (unused)
+            client_id: Client identifier
+            request_id: Correlation id of the audio_end message
+
+        Returns:
+            Error dict, or a callable returning the coroutine that produces
+            the audio_command response
+        """
+        client = self.clients[client_id]
+        upload, client.upload = client.upload, None
+        if upload is None or upload.length == 0:
+            return {"status": "error", "message": "Missing audio data"}
+        if upload.partial_task is not None:
+            # The final decode supersedes any partial still running; the pool
+            # keeps the partial's slot until its worker actually finishes
+            upload.partial_task.cancel()
+
+        print(f"{color_style.LOGGER} Received {upload.length} bytes in {upload.chunks} binary frames from {client_id}")
+        return functools.partial(
+            self.process_audio, upload.view(), upload.audio_format, client_id, upload.profile
+        )
+
+    async def process_audio(
+        self, audio_bytes, audio_format: str, client_id: str, profile: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Transcribe an utterance and build the audio_command response"""
+        try:
+            if audio_format not in SUPPORTED_AUDIO_FORMATS:
                 return {"status": "error", "message": f"Unsupported audio format: {audio_format}"}
 
             # Get transcription using Whisper STT
             print(f"{color_style.LOGGER} Processing {audio_format.upper()} audio...")
-            transcription = await whisper_service.transcribe_audio(audio_bytes, audio_format=audio_format)
+            result = await whisper_service.transcribe_audio(
+                audio_bytes, audio_format=audio_format, profile=profile
+            )
+            transcription = result["text"]
             print(f"{color_style.LOGGER} Transcription result: {transcription}")
 
             # TODO: Implement Natural Language Processing (NLP)
@@ -126,11 +641,22 @@ class ConnectionManager:
                 "status": "success",
                 "data": {
                     "transcription": transcription,
+                    "stt": {
+                        "language": result["language"],
+                        "audio_seconds": result["audio_seconds"],
+                        "decoded_seconds": result["decoded_seconds"],
+                        "chunks": result["chunks"],
+                        "profile": result["profile"],
+                    },
                     # s# "audio": response_audio_base64,  # Base64 encoded MP3
                     "timestamp": datetime.now().isoformat(),
                 },
             }
 
+        except whisper_service.WhisperBusyError as e:
+            return {"status": "error", "type": "busy", "message": str(e)}
+        except whisper_service.NoSpeechError as e:
+            return {"status": "error", "type": "no_speech", "message": str(e)}
         except Exception as e:
             print(f"{color_style.ERROR} Audio processing error: {str(e)}")
             return {"status": "error", "message": f"Audio processing failed: {str(e)}"}
@@ -202,23 +728,30 @@ class ConnectionManager:
             return {"status": "error", "message": "Missing entity_id"}
 
         try:
-            domain = entity_id.split(".")[0]
-            devices = await ha_service.get_single_ha_device(domain)
-
-            for device in devices:
-                if device.get("entity_id") == entity_id:
-                    return {
-                        "status": "success",
-                        "type": "device_state",
-                        "data": {
-                            "entity_id": entity_id,
-                            "state": device.get("state", "unknown"),
-                            "attributes": device.get("attributes", {}),
-                        },
-                    }
+            device = await ha_service.get_ha_device(
+                entity_id, refresh=bool(data.get("refresh", False))
+            )
+
+            if device:
+                return {
+                    "status": "success",
+                    "type": "device_state",
+                    "data": {
+                        "entity_id": entity_id,
+                        "state": device.get("state", "unknown"),
+                        "attributes": device.get("attributes", {}),
+                    },
+                }
 
             return {"status": "error", "message": f"Device not found: {entity_id}"}
 
+        except HTTPException as e:
+            if e.status_code == 404:
+                return {"status": "error", "message": f"Device not found: {entity_id}"}
+            return {
+                "status": "error",
+                "message": f"Error getting device state: {e.detail}",
+            }
         except Exception as e:
             return {
                 "status": "error",
@@ -226,47 +759,261 @@ class ConnectionManager:
             }
 
     async def handle_text_command(
-        self, data: Dict[str, Any], client_id: str
+        self, data: Dict[str, Any], client_id: str, request_id: Any = None
     ) -> Dict[str, Any]:
         """
         Handle natural language text commands
 
         Args:
-            data: Message data with text command
+            data: Message data with text command, optionally no_cache=true
+                to bypass the Gemini response cache and stream=true to
+                receive assistant_partial messages while Gemini answers.
+                history may be omitted: the server keeps the conversation
+                per session_id (or per connection).
+                Simple on/off/toggle commands are matched locally and never
+                reach Gemini.
             client_id: Client identifier
+            request_id: Correlation id, repeated on assistant_partial messages
 
         Returns:
             Dict with NLP processing result
         """
         
+        timings: Dict[str, float] = {}
+        usage: Dict[str, Any] = {}
+        started = time.perf_counter()
         try:
             entity_id = data.get("entity_id")
-            
-            object_ = await ha_service.get_ha_device(entity_id=entity_id)
-            if not object_:
-                return {"status": "error", "message": f"Device not found: {entity_id}"}
-            
             dialogue = data.get("text")
             if not dialogue:
                 return {"status": "error", "message": "Missing text field"}
-            history = data.get("history", [])
+
+            # Device state (usually from the state cache), the local intent
+            # match and the conversation history don't depend on each other
+            device = asyncio.create_task(
+                timed(timings, "device", ha_service.get_ha_device(entity_id=entity_id))
+            )
+            try:
+                intent, history = await asyncio.gather(
+                    timed(timings, "intent", intent_service.match(dialogue, entity_id)),
+                    timed(timings, "history", self._load_history(data, client_id)),
+                )
+                object_ = await device
+            finally:
+                device.cancel()
+            if not object_:
+                return {"status": "error", "message": f"Device not found: {entity_id}"}
+
+            # Obvious on/off/toggle commands are executed without Gemini
+            if intent:
+                target = intent["entity_id"]
+                current = object_ if target == entity_id else state_cache.get(target)
+                new_state = intent_service.resolve_state(intent["action"], current)
+                print(f"{color_style.LOGGER} Local intent: {intent['action']} on {target}")
+                await timed(timings, "action", ha_service.change_ha_entity_state(target, new_state))
+                nlp_result = intent_service.build_reply(target, new_state, current)
+                self._remember(data, client_id, dialogue, nlp_result)
+                return self._with_timings({"status": "success", "data": nlp_result}, timings, started)
+
             request = {
-                "object": entity_id,
+                "object": {
+                    "entity_id": entity_id,
+                    "state": object_.get("state"),
+                    "attributes": object_.get("attributes", {}),
+                },
                 "dialogue": dialogue,
                 "history": history
             }
             print(f"{color_style.LOGGER} Command received by text: {request}")
-            nlp_result = await ai_service.ask_gemini(request)
+            use_cache = not data.get("no_cache", False)
+            if data.get("stream", settings.gemini_stream):
+                response = await self._stream_text_command(
+                    request, entity_id, object_, use_cache, client_id, request_id, timings, usage
+                )
+                self._remember(data, client_id, dialogue, response["data"])
+                return self._with_timings(response, timings, started, usage)
+
+            nlp_result = await timed(timings, "gemini", ai_service.ask_gemini(
+                request,
+                entity_state=object_,
+                use_cache=use_cache,
+                usage=usage,
+            ))
             nlp_result = json.loads(nlp_result)
             instruction = nlp_result.get("instruction")
             if instruction:
                 print(f"{color_style.LOGGER} Executing instruction: {instruction} on {entity_id}")
-                await ha_service.change_ha_entity_state(entity_id, instruction)
-            return {"status": "success", "data": nlp_result}
+                await timed(timings, "action", ha_service.change_ha_entity_state(entity_id, instruction))
+            self._remember(data, client_id, dialogue, nlp_result)
+            return self._with_timings({"status": "success", "data": nlp_result}, timings, started, usage)
 
         except Exception as e:
             return {"status": "error", "message": f"NLP processing error: {str(e)}"}
 
+    @staticmethod
+    def _session_id(data: Dict[str, Any], client_id: str) -> str:
+        """Conversation key: the client's session_id, else the connection"""
+        return str(data.get("session_id") or client_id)
+
+    async def _load_history(self, data: Dict[str, Any], client_id: str) -> List[Dict[str, Any]]:
+        """Conversation history for a text_command.
+
+        Clients that still send their own (non-empty) history get it used as
+        before; a missing or empty one means the server-side memory of the
+        session is used.
+        """
+        if data.get("history"):
+            return data["history"]
+        return conversation_service.memory.history(self._session_id(data, client_id))
+
+    def _remember(self, data: Dict[str, Any], client_id: str, dialogue: str, reply: Dict[str, Any]):
+        """Record a completed exchange in the session's conversation memory"""
+        session_id = self._session_id(data, client_id)
+        conversation_service.memory.add(session_id, "user", dialogue)
+        if not isinstance(reply, dict):
+            return
+        answer = reply.get("comment") or reply.get("suggest")
+        if answer:
+            conversation_service.memory.add(session_id, "assistant", answer)
+
+    @staticmethod
+    def _with_timings(
+        response: Dict[str, Any],
+        timings: Dict[str, float],
+        started: float,
+        usage: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Attach per-stage timings (ms), the end-to-end total and Gemini token usage to a response"""
+        timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+        print(f"{color_style.LOGGER} text_command timings (ms): {timings}")
+        response = {**response, "timings": timings}
+        if usage:
+            response["usage"] = usage
+        return response
+
+    async def _stream_text_command(
+        self,
+        request: Dict[str, Any],
+        entity_id: str,
+        object_: Dict[str, Any],
+        use_cache: bool,
+        client_id: str,
+        request_id: Any = None,
+        timings: Optional[Dict[str, float]] = None,
+        usage: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Ask Gemini in streaming mode for a text_command.
+
+        The comment is pushed to the client as assistant_partial messages
+        while it is generated, and the instruction is sent to Home
+        Assistant as soon as its field is complete instead of after the
+        whole reply.
+        """
+        timings = timings if timings is not None else {}
+        started = time.perf_counter()
+        action: Optional[asyncio.Task] = None
+
+        async def on_comment(delta: str, comment: str):
+            timings.setdefault("first_partial", round((time.perf_counter() - started) * 1000, 2))
+            await self.send_message(client_id, {
+                "status": "success",
+                "type": "assistant_partial",
+                "request_id": request_id,
+                "data": {"delta": delta, "comment": comment},
+            })
+
+        async def on_instruction(instruction: str):
+            nonlocal action
+            print(f"{color_style.LOGGER} Executing instruction: {instruction} on {entity_id}")
+            action = asyncio.create_task(
+                timed(timings, "action", ha_service.change_ha_entity_state(entity_id, instruction))
+            )
+
+        try:
+            nlp_result = await timed(timings, "gemini", ai_service.ask_gemini_stream(
+                request,
+                entity_state=object_,
+                use_cache=use_cache,
+                on_comment=on_comment,
+                on_instruction=on_instruction,
+                usage=usage,
+            ))
+        finally:
+            # An action already sent is finished even if the stream broke off
+            if action is not None:
+                await action
+        return {"status": "success", "data": json.loads(nlp_result)}
+
+    @staticmethod
+    def _parse_topics(data: Dict[str, Any]) -> Optional[Dict[str, List[str]]]:
+        topics = {}
+        for topic in SubscriptionIndex.TOPICS:
+            values = data.get(topic, [])
+            if isinstance(values, str):
+                values = [values]
+            if not isinstance(values, list) or not all(isinstance(v, str) and v for v in values):
+                return None
+            topics[topic] = values
+        return topics
+
+    async def handle_subscribe(
+        self, data: Dict[str, Any], client_id: str
+    ) -> Dict[str, Any]:
+        """
+        Subscribe the client to entity updates
+
+        Once a client subscribes it only receives entity_state_changed and
+        iot_state_changed broadcasts for matching entities.
+
+        Args:
+            data: Message data with entity_ids, domains and/or glob patterns
+            client_id: Client identifier
+
+        Returns:
+            Dict with the client's current subscriptions
+        """
+        topics = self._parse_topics(data)
+        if topics is None:
+            return {"status": "error", "message": "entity_ids, domains and patterns must be lists of strings"}
+
+        self.subscriptions.subscribe(client_id, topics)
+        self.unfiltered.discard(client_id)
+        return {
+            "status": "success",
+            "type": "subscriptions",
+            "data": self.subscriptions.topics_of(client_id),
+        }
+
+    async def handle_unsubscribe(
+        self, data: Dict[str, Any], client_id: str
+    ) -> Dict[str, Any]:
+        """
+        Unsubscribe the client from entity updates
+
+        Args:
+            data: Message data with entity_ids, domains and/or glob patterns,
+                or "all": true to go back to receiving every broadcast
+            client_id: Client identifier
+
+        Returns:
+            Dict with the client's remaining subscriptions
+        """
+        if data.get("all"):
+            self.subscriptions.remove_client(client_id)
+            if client_id in self.clients:
+                self.unfiltered.add(client_id)
+        else:
+            topics = self._parse_topics(data)
+            if topics is None:
+                return {"status": "error", "message": "entity_ids, domains and patterns must be lists of strings"}
+            self.subscriptions.unsubscribe(client_id, topics)
+
+        return {
+            "status": "success",
+            "type": "subscriptions",
+            "data": self.subscriptions.topics_of(client_id),
+        }
+
     async def handle_status_request(
         self, data: Dict[str, Any], client_id: str
     ) -> Dict[str, Any]:
@@ -284,11 +1031,37 @@ class ConnectionManager:
             "status": "success",
             "data": {
                 "connected_clients": len(self.active_connections),
+                "outbound": self.stats(),
+                "whisper": whisper_service.pool.stats(),
+                "gemini_cache": ai_service.response_cache.stats(),
+                "gemini_context_cache": ai_service.context_cache.stats(),
+                "gemini_usage": prompt_service.usage_stats.stats(),
+                "gemini_client": gemini_client.stats(),
+                "conversations": conversation_service.memory.stats(),
+                "ha_state_cache": state_cache.stats(),
+                "state_writer": state_writer.stats(),
                 "home_assistant_status": "connected",
                 "timestamp": datetime.now().isoformat(),
             },
         }
 
+    async def handle_reset_conversation(
+        self, data: Dict[str, Any], client_id: str
+    ) -> Dict[str, Any]:
+        """
+        Forget the server-side conversation memory of a session
+
+        Args:
+            data: Message data, optionally with session_id
+            client_id: Client identifier
+
+        Returns:
+            Dict with confirmation
+        """
+        session_id = self._session_id(data, client_id)
+        conversation_service.memory.clear(session_id)
+        return {"status": "success", "type": "conversation_reset", "data": {"session_id": session_id}}
+
     async def handle_ping(self, data: Dict[str, Any], client_id: str) -> Dict[str, Any]:
         """
         Handle ping/keep-alive messages
@@ -0,0 +1,190 @@
+"""In-memory audio decoding for speech-to-text.
+
+Everything returns mono float32 samples in [-1, 1] at SAMPLE_RATE, which is
+what faster-whisper accepts in place of a file path.
+"""
+import io
+import struct
+from typing import List, Tuple
+import numpy as np
+
+# Whisper models expect 16 kHz mono audio
+SAMPLE_RATE = 16000
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def _parse_wav(data: memoryview):
+    """Return (format_tag, channels, rate, sample_width, pcm view) of a RIFF/WAVE buffer"""
+    if len(data) < 12 or bytes(data[0:4]) != b"RIFF" or bytes(data[8:12]) != b"WAVE":
+        raise ValueError("Invalid WAV file: missing RIFF/WAVE header")
+
+    fmt = None
+    pcm = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = bytes(data[offset:offset + 4])
+        (chunk_size,) = struct.unpack_from("<I", data, offset + 4)
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            if chunk_size < 16:
+                raise ValueError("Invalid WAV file: short fmt chunk")
+            format_tag, channels, rate, _, _, bits = struct.unpack_from("<HHIIHH", data, body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 26:
+                (format_tag,) = struct.unpack_from("<H", data, body + 24)
+            fmt = (format_tag, channels, rate, bits // 8)
+        elif chunk_id == b"data":
+            # Recorders that stream WAV leave the size as a 0 or 0xFFFFFFFF
+            # placeholder, or too large: read to the end of the buffer then
+            if chunk_size in (0, 0xFFFFFFFF):
+                chunk_size = len(data) - body
+            pcm = data[body:min(body + chunk_size, len(data))]
+            break
+        # Chunks are word aligned
+        offset = body + chunk_size + (chunk_size & 1)
+
+    if fmt is None or pcm is None:
+        raise ValueError("Invalid WAV file: missing fmt or data chunk")
+    format_tag, channels, rate, width = fmt
+    if channels < 1 or rate < 1:
+        raise ValueError(f"Invalid WAV file: channels={channels}, rate={rate}")
+    return format_tag, channels, rate, width, pcm
+
+
+def _pcm_to_float32(pcm: memoryview, format_tag: int, width: int) -> np.ndarray:
+    usable = len(pcm) - len(pcm) % width
+    pcm = pcm[:usable]
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        if width == 4:
+            return np.frombuffer(pcm, dtype="<f4").astype(np.float32, copy=False)
+        if width == 8:
+            return np.frombuffer(pcm, dtype="<f8").astype(np.float32)
+    elif format_tag == WAVE_FORMAT_PCM:
+        if width == 1:
+            return (np.frombuffer(pcm, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        if width == 2:
+            return np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+        if width == 3:
+            raw = np.frombuffer(pcm, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            samples = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+            samples = np.where(samples & 0x800000, samples - 0x1000000, samples)
+            return samples.astype(np.float32) / 8388608.0
+        if width == 4:
+            return np.frombuffer(pcm, dtype="<i4").astype(np.float32) / 2147483648.0
+    raise ValueError(f"Unsupported WAV encoding: format={format_tag}, width={width}")
+
+
+def to_mono(samples: np.ndarray, channels: int) -> np.ndarray:
+    if channels == 1:
+        return samples
+    frames = len(samples) // channels
+    return samples[:frames * channels].reshape(frames, channels).mean(axis=1, dtype=np.float32)
+
+
+def resample(samples: np.ndarray, rate: int, target: int = SAMPLE_RATE) -> np.ndarray:
+    """Linear-interpolation resampling; enough for speech going into Whisper"""
+    if rate == target or len(samples) == 0:
+        return samples
+    out_len = int(round(len(samples) * target / rate))
+    positions = np.arange(out_len, dtype=np.float64) * (rate / target)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def decode_wav(data) -> np.ndarray:
+    """Decode WAV bytes straight from memory, without a temp file"""
+    format_tag, channels, rate, width, pcm = _parse_wav(memoryview(data).cast("B"))
+    samples = _pcm_to_float32(pcm, format_tag, width)
+    return resample(to_mono(samples, channels), rate)
+
+
+def decode_compressed(data) -> np.ndarray:
+    """Decode compressed audio (mp3, ...) from an in-memory stream.
+
+    faster-whisper's decoder (PyAV/FFmpeg) reads from any file-like object,
+    so the bytes are piped through it rather than written to disk.
+    """
+    from faster_whisper import decode_audio
+
+    return decode_audio(io.BytesIO(data), sampling_rate=SAMPLE_RATE)
+
+
+def decode_audio(data, audio_format: str = "wav") -> np.ndarray:
+    """Decode an utterance to 16 kHz mono float32"""
+    if audio_format.lower() == "wav":
+        return decode_wav(data)
+    return decode_compressed(data)
+
+
+def duration(samples: np.ndarray) -> float:
+    """Length in seconds of decoded samples"""
+    return len(samples) / SAMPLE_RATE
+
+
+def speech_segments(
+    samples: np.ndarray,
+    threshold_db: float = -40.0,
+    dynamic_range_db: float = 35.0,
+    min_pause: float = 0.5,
+    padding: float = 0.2,
+    frame_ms: int = 30,
+) -> List[Tuple[int, int]]:
+    """Energy based voice activity detection.
+
+    A frame is speech when its RMS level is above `threshold_db` (dBFS) and
+    within `dynamic_range_db` of the loudest frame. Speech runs separated by
+    less than `min_pause` seconds are merged, then padded on both sides.
+
+    Returns:
+        List of (start, end) sample offsets, in order and non-overlapping.
+    """
+    frame = SAMPLE_RATE * frame_ms // 1000
+    count = len(samples) // frame
+    if count == 0:
+        return []
+
+    frames = samples[:count * frame].reshape(count, frame)
+    level = 10.0 * np.log10(np.mean(np.square(frames, dtype=np.float32), axis=1) + 1e-12)
+    voiced = np.flatnonzero(level > max(threshold_db, level.max() - dynamic_range_db))
+    if voiced.size == 0:
+        return []
+
+    breaks = np.flatnonzero(np.diff(voiced) > max(1, int(min_pause * 1000 / frame_ms)))
+    starts = np.concatenate(([voiced[0]], voiced[breaks + 1])) * frame
+    ends = (np.concatenate((voiced[breaks], [voiced[-1]])) + 1) * frame
+
+    pad = int(padding * SAMPLE_RATE)
+    segments: List[Tuple[int, int]] = []
+    for start, end in zip(starts, ends):
+        start, end = max(0, int(start) - pad), min(len(samples), int(end) + pad)
+        if segments and start <= segments[-1][1]:
+            segments[-1] = (segments[-1][0], end)
+        else:
+            segments.append((start, end))
+    return segments
+
+
+def split_speech(samples: np.ndarray, max_chunk: float = 30.0, **vad_options) -> List[np.ndarray]:
+    """Trim silence and cut the speech into chunks of at most `max_chunk` seconds.
+
+    Pauses between speech segments are dropped and chunks are only cut at
+    those pauses, unless a single segment is longer than `max_chunk`.
+    Returns an empty list when no speech was found.
+    """
+    limit = int(max_chunk * SAMPLE_RATE)
+    chunks: List[np.ndarray] = []
+    current: List[np.ndarray] = []
+    size = 0
+    for start, end in speech_segments(samples, **vad_options):
+        # Hard split of segments that alone exceed the limit
+        for offset in range(start, end, limit):
+            piece = samples[offset:min(end, offset + limit)]
+            if size + len(piece) > limit and current:
+                chunks.append(np.concatenate(current))
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece)
+    if current:
+        chunks.append(np.concatenate(current))
+    return chunks
@@ -0,0 +1,71 @@
+"""Micro-benchmark: temp-file audio path vs in-memory decoding.
+
+Compares what transcribe_audio used to do before handing audio to Whisper
+(write a NamedTemporaryFile, reopen it with `wave`, let the model decode
+the path) with decoding the bytes in memory via app.utils.audio.
+
+Run from the orchestator-backend folder:
+        python -m benchmarks.bench_audio_decode
+"""
+import io
+import os
+import tempfile
+import timeit
+import wave
+import numpy as np
+from app.utils import audio
+
+SECONDS = 5
+RATE = 44100
+CHANNELS = 2
+RUNS = 50
+
+
+def make_wav(seconds: int = SECONDS, rate: int = RATE, channels: int = CHANNELS) -> bytes:
+    t = np.arange(seconds * rate) / rate
+    tone = (0.3 * np.sin(2 * np.pi * 220 * t) * 32767).astype("<i2")
+    frames = np.repeat(tone[:, None], channels, axis=1)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(frames.tobytes())
+    return buffer.getvalue()
+
+
+def tempfile_path(data: bytes):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
+        tmp.write(data)
+        tmp.flush()
+        tmp_path = tmp.name
+    try:
+        with wave.open(tmp_path, "rb") as wav:
+            wav.getnchannels(), wav.getsampwidth(), wav.getframerate(), wav.getnframes()
+        try:
+            from faster_whisper import decode_audio
+        except ImportError:
+            # Without faster-whisper, approximate its decode step with wave + numpy
+            with wave.open(tmp_path, "rb") as wav:
+                raw = wav.readframes(wav.getnframes())
+            samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+            return audio.resample(audio.to_mono(samples, CHANNELS), RATE)
+        return decode_audio(tmp_path, sampling_rate=audio.SAMPLE_RATE)
+    finally:
+        os.remove(tmp_path)
+
+
+def in_memory(data: bytes):
+    return audio.decode_audio(data, "wav")
+
+
+def main():
+    data = make_wav()
+    print(f"{SECONDS}s {RATE} Hz {CHANNELS}ch WAV, {len(data)} bytes, {RUNS} runs")
+    for name, func in (("tempfile", tempfile_path), ("in-memory", in_memory)):
+        best = min(timeit.repeat(lambda: func(data), number=RUNS, repeat=3)) / RUNS
+        print(f"  {name:<10} {best * 1000:8.3f} ms/utterance")
+
+
+if __name__ == "__main__":
+    main()
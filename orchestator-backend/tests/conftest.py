@@ -0,0 +1,16 @@
+import os
+
+# Settings require these; the tests never connect to any of them
+for name, value in {
+    "DB_USER": "test",
+    "DB_PASS": "test",
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "DB_NAME": "test",
+    "HA_URL": "http://homeassistant.local:8123/api",
+    "HA_WEBSOCKET_URL": "ws://homeassistant.local:8123/api/websocket",
+    "HA_TOKEN": "test",
+    "GEMINI_API_KEY": "test",
+    "GEMINI_BASE_URL": "http://gemini.local",
+}.items():
+    os.environ.setdefault(name, value)
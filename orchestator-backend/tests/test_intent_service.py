@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from app.services import intent_service
+from app.services.intent_service import match_action, normalize
+
+
+def action(text):
+    return match_action(normalize(text))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("turn on the light", "turn_on"),
+    ("Turn off the lamp.", "turn_off"),
+    ("turn the kitchen light on", "turn_on"),
+    ("please switch off the fan", "turn_off"),
+    ("switch off the fan please", "turn_off"),
+    ("turn on the light for me", "turn_on"),
+    ("turn on the light in the kitchen", "turn_on"),
+    ("toggle the lamp", "toggle"),
+    ("enciende la luz", "turn_on"),
+    ("por favor apaga la luz", "turn_off"),
+    ("apaga el ventilador por favor", "turn_off"),
+    ("prende la lámpara", "turn_on"),
+    ("enciende la luz en la cocina", "turn_on"),
+])
+def test_imperative_commands_match(text, expected):
+    assert action(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    # Times, durations and conditions
+    "turn off the light at 10 pm",
+    "turn on the light tomorrow",
+    "turn off the light for 5 minutes",
+    "turn on the light in 5 minutes",
+    "turn on the light in the morning",
+    "turn the light off tonight",
+    "turn on the light when I arrive",
+    "turn on the light if it's dark",
+    "apaga la luz a las 10",
+    "enciende la luz mañana",
+    "apaga la luz en 5 minutos",
+    "enciende la luz en la noche",
+    "apaga la luz si no hay nadie",
+    "cuando llegue enciende la luz",
+    # Questions, modals, reminders and reports
+    "is the light on",
+    "should I turn off the light",
+    "can you remind me to turn off the light",
+    "please can you turn on the light",
+    "por favor puedes apagar la luz",
+    "I forgot to turn off the light",
+    "recuérdame apagar la luz",
+    # Negations and compound requests
+    "don't turn on the light",
+    "turn on the light and the fan",
+    "turn on the light, then off",
+    "no apagues la luz",
+])
+def test_non_immediate_requests_fall_back(text):
+    assert action(text) is None
+
+
+def test_match_targets_current_object(monkeypatch):
+    async def refresh(force=False):
+        pass
+
+    monkeypatch.setattr(intent_service.alias_index, "refresh", refresh)
+    monkeypatch.setattr(intent_service.alias_index, "aliases", {})
+    result = asyncio.run(intent_service.match("Please turn off the light", "light.desk"))
+    assert result == {"action": "turn_off", "entity_id": "light.desk"}
+    assert asyncio.run(intent_service.match("turn off the light at 10 pm", "light.desk")) is None